@@ -0,0 +1,156 @@
+import heapq
+import threading
+from collections import Counter
+from datetime import datetime
+
+import storage
+from event_log import SEARCH_CLICK_WINDOW, EventLogTailer
+
+
+class TopK:
+    """Đếm tần suất và giữ sẵn K phần tử lớn nhất bằng min-heap.
+
+    Số đếm chỉ tăng, nên phần tử ngoài top chỉ vào top khi vượt phần tử nhỏ nhất.
+    """
+
+    def __init__(self, k=10):
+        self.k = k
+        self.counts = Counter()
+        self.top = {}
+        self._heap = []
+        self._sorted = []
+        self._dirty = False
+
+    def _pop_min(self):
+        # Bỏ qua các entry cũ (số đếm đã tăng sau khi push)
+        while self._heap:
+            count, key = self._heap[0]
+            if self.top.get(key) == count:
+                return count, key
+            heapq.heappop(self._heap)
+        return None
+
+    def add(self, key, amount=1):
+        self.counts[key] += amount
+        count = self.counts[key]
+
+        if key not in self.top:
+            if len(self.top) >= self.k:
+                min_count, min_key = self._pop_min()
+                if count <= min_count:
+                    return
+                del self.top[min_key]
+                heapq.heappop(self._heap)
+
+        self.top[key] = count
+        heapq.heappush(self._heap, (count, key))
+        self._dirty = True
+
+        # Dọn entry cũ khi heap phình quá lớn
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(c, k) for k, c in self.top.items()]
+            heapq.heapify(self._heap)
+
+    def subtract(self, counts):
+        """Trừ bớt số đếm (ví dụ bucket ra khỏi cửa sổ) rồi chọn lại top K từ toàn bộ số đếm"""
+        self.counts -= counts
+        self.top = dict(heapq.nlargest(self.k, self.counts.items(), key=lambda x: x[1]))
+        self._heap = [(count, key) for key, count in self.top.items()]
+        heapq.heapify(self._heap)
+        self._dirty = True
+
+    def scale(self, factor):
+        """Nhân mọi số đếm với `factor` (> 0), thứ tự không đổi"""
+        self.counts = Counter({key: count * factor for key, count in self.counts.items()})
+        self.top = {key: count * factor for key, count in self.top.items()}
+        self._heap = [(count, key) for key, count in self.top.items()]
+        heapq.heapify(self._heap)
+        self._dirty = True
+
+    def items(self):
+        if self._dirty:
+            self._sorted = sorted(self.top.items(), key=lambda x: x[1], reverse=True)
+            self._dirty = False
+        return self._sorted
+
+
+def to_epoch(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class AnalyticsAggregator:
+    """Bộ đếm chạy liên tục cho trang thống kê admin.
+
+    Lượt xem / tìm kiếm được đọc tiếp từ event log, đơn hàng từ bảng orders theo id tăng dần,
+    nên mỗi lần cập nhật chỉ xử lý phần dữ liệu mới.
+    """
+
+    def __init__(self, k=10, window=SEARCH_CLICK_WINDOW):
+        self.window = window
+        self.most_viewed = TopK(k)
+        self.most_purchased = TopK(k)
+        self.top_searches = TopK(k)
+        self.clicked_after_search = TopK(k)
+        self.revenue = Counter()
+        self.last_search_at = {}
+        self._tailer = EventLogTailer()
+        self._last_order_id = 0
+        self._lock = threading.Lock()
+
+    def consume(self, event):
+        ts = to_epoch(event.get('ts'))
+
+        if event['type'] == 'view':
+            self.most_viewed.add(event['product_id'])
+
+            # Join theo cửa sổ thời gian: view trong `window` giây sau lần search gần nhất
+            searched_at = self.last_search_at.get(event['user_id'])
+            if ts is not None and searched_at is not None and 0 <= ts - searched_at <= self.window:
+                self.clicked_after_search.add(event['product_id'])
+
+        elif event['type'] == 'search':
+            query = event['query'].strip().lower()
+            if query:
+                self.top_searches.add(query)
+            if ts is not None:
+                self.last_search_at[event['user_id']] = ts
+
+    def consume_order(self, order):
+        self.most_purchased.add(order['product_id'], order['quantity'])
+        self.revenue[order['product_id']] += order['total_price']
+
+    def refresh(self):
+        with self._lock:
+            for event in self._tailer.read_new():
+                self.consume(event)
+
+            for order in storage.get_orders_after(self._last_order_id):
+                self.consume_order(order)
+                self._last_order_id = order['id']
+        return self
+
+    def report(self, products_by_id):
+        self.refresh()
+
+        def with_products(top, field):
+            return [{**products_by_id[pid], field: count}
+                    for pid, count in top.items() if pid in products_by_id]
+
+        # Đọc các TopK trong lock: refresh() của thread khác đang cập nhật chúng
+        with self._lock:
+            most_purchased = with_products(self.most_purchased, 'purchase_count')
+            for product in most_purchased:
+                product['revenue'] = self.revenue[product['id']]
+
+            return {
+                'most_viewed': with_products(self.most_viewed, 'view_count'),
+                'most_purchased': most_purchased,
+                'top_searches': list(self.top_searches.items()),
+                'most_clicked_after_search': with_products(self.clicked_after_search, 'click_count')
+            }
+
+
+analytics = AnalyticsAggregator()
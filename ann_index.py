@@ -0,0 +1,138 @@
+import numpy as np
+
+
+def select_top_k(ids, scores, k):
+    """Chọn k cột điểm cao nhất trên mỗi hàng, sắp xếp giảm dần"""
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(ids, top, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+class IVFIndex:
+    """Chỉ mục ANN kiểu IVF viết bằng NumPy cho vector float32 đã chuẩn hoá (điểm = cosine).
+
+    Vector được chia thành `n_lists` cụm bằng k-means; mỗi truy vấn chỉ so với các vector
+    trong `nprobe` cụm có centroid gần nhất. nprobe là nút chỉnh recall / độ trễ:
+    tăng nprobe thì recall cao hơn nhưng chậm hơn, nprobe = n_lists là tìm chính xác.
+    """
+
+    def __init__(self, n_lists=None, nprobe=8, n_iter=10, max_train=50000, seed=0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.max_train = max_train
+        self.seed = seed
+        self.vectors = None
+        self.centroids = None
+        # Chỉ số hàng sắp theo cụm; hàng của cụm l nằm trong order[offsets[l]:offsets[l + 1]]
+        self.order = None
+        self.offsets = None
+
+    def fit(self, vectors):
+        n = len(vectors)
+        n_lists = self.n_lists or int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(n, min(n, self.max_train), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        # k-means trên mặt cầu: gán theo tích vô hướng, centroid là trung bình đã chuẩn hoá
+        for _ in range(self.n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        return self.assign(vectors, centroids)
+
+    def assign(self, vectors, centroids, chunk_size=8192):
+        """Gán toàn bộ vector vào các cụm có sẵn (dùng khi thêm/đổi vector mà không train lại)"""
+        assign = np.concatenate([
+            np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk_size)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+        self.vectors = vectors
+        self.centroids = centroids
+        self.n_lists = len(centroids)
+        self.order = np.argsort(assign, kind='stable')
+        self.offsets = np.searchsorted(assign[self.order], np.arange(len(centroids) + 1))
+        return self
+
+    @classmethod
+    def from_arrays(cls, vectors, centroids, order, offsets, nprobe=8):
+        index = cls(n_lists=len(centroids), nprobe=nprobe)
+        index.vectors, index.centroids, index.order, index.offsets = vectors, centroids, order, offsets
+        return index
+
+    def arrays(self):
+        return {'ivf_centroids': self.centroids, 'ivf_order': self.order, 'ivf_offsets': self.offsets}
+
+    def search(self, queries, k, nprobe=None, exclude_rows=None, chunk_size=4096):
+        """Top-k (chỉ số hàng, điểm) cho mỗi truy vấn, điểm giảm dần.
+
+        `exclude_rows[i]` là hàng bỏ qua của truy vấn i (vd. chính nó). Chỗ thiếu có hàng -1, điểm -inf.
+        """
+        queries = np.atleast_2d(queries)
+        n_queries = len(queries)
+        nprobe = max(1, min(nprobe or self.nprobe, self.n_lists))
+
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), (n_queries, self.n_lists))
+
+        best_rows = np.full((n_queries, k), -1, dtype=np.int64)
+        best_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+
+        if n_queries <= 16:
+            # Ít truy vấn (truy vấn online): gom ứng viên của từng truy vấn, nhân một lần
+            for i in range(n_queries):
+                members = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in probes[i]])
+                sims = (self.vectors[members] @ queries[i]).astype(np.float32)
+                if exclude_rows is not None:
+                    sims[members == exclude_rows[i]] = -np.inf
+                top = min(k, len(members))
+                if top:
+                    rows, scores = select_top_k(members[None, :], sims[None, :], top)
+                    best_rows[i, :top], best_scores[i, :top] = rows[0], scores[0]
+            return best_rows, best_scores
+
+        # Đảo (truy vấn, cụm) thành danh sách truy vấn của từng cụm: số vòng lặp Python ≤ số cụm
+        pair_lists = probes.ravel()
+        pair_queries = np.repeat(np.arange(n_queries), probes.shape[1])[np.argsort(pair_lists, kind='stable')]
+        bounds = np.searchsorted(np.sort(pair_lists, kind='stable'), np.arange(self.n_lists + 1))
+
+        # Chỉ duyệt các cụm có truy vấn probe tới
+        for l in np.nonzero(np.diff(bounds))[0].tolist():
+            members = self.order[self.offsets[l]:self.offsets[l + 1]]
+            if not len(members):
+                continue
+            list_queries = pair_queries[bounds[l]:bounds[l + 1]]
+
+            list_vectors = self.vectors[members]
+            for start in range(0, len(list_queries), chunk_size):
+                q = list_queries[start:start + chunk_size]
+                sims = (queries[q] @ list_vectors.T).astype(np.float32)
+                if exclude_rows is not None:
+                    sims[exclude_rows[q][:, None] == members[None, :]] = -np.inf
+
+                candidate_rows = np.hstack([best_rows[q], np.broadcast_to(members, sims.shape)])
+                candidate_scores = np.hstack([best_scores[q], sims])
+                best_rows[q], best_scores[q] = select_top_k(candidate_rows, candidate_scores, k)
+
+        return best_rows, best_scores
@@ -0,0 +1,300 @@
+"""Đo hiệu năng recommender và các route Flask trên dữ liệu giả lập.
+
+Mỗi quy mô chạy trong một process riêng, trong thư mục tạm có đủ các file JSON
+(products, users, orders, recent_views, search_history) và events.log như khi chạy thật.
+
+    python benchmark.py --scales 1k,100k --output benchmark_report.json
+    python benchmark.py --scales 1k --compare benchmark_report.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Số sản phẩm, số user và số sự kiện (lượt xem + tìm kiếm + đơn hàng) của từng quy mô
+SCALES = {
+    '1k': {'products': 1000, 'users': 200, 'events': 1000},
+    '100k': {'products': 100000, 'users': 10000, 'events': 100000},
+    '1m': {'products': 1000000, 'users': 50000, 'events': 1000000},
+}
+
+BRANDS = ['Dell', 'HP', 'Lenovo', 'Asus', 'Acer', 'MSI', 'Apple', 'Samsung', 'LG', 'Gigabyte']
+CATEGORIES = ['Gaming', 'Văn phòng', 'Cao cấp', 'Đồ họa', 'Học sinh - Sinh viên', 'Mỏng nhẹ']
+WORDS = ['laptop', 'gaming', 'màn hình', 'inch', 'core', 'i5', 'i7', 'i9', 'ryzen', 'rtx', '3050', '4060',
+         'ram', '8gb', '16gb', '32gb', 'ssd', '512gb', '1tb', 'oled', '120hz', '144hz', 'pin', 'mỏng',
+         'nhẹ', 'văn phòng', 'đồ họa', 'cao cấp', 'giá tốt', 'bền', 'bàn phím', 'led', 'wifi', 'usb-c']
+SEARCH_TERMS = [w.lower() for w in BRANDS] + ['gaming', 'rtx', 'oled', 'mỏng nhẹ', 'văn phòng', 'i7', 'ryzen', 'ssd']
+
+# Số lần lặp của mỗi phép đo (quy mô lớn giảm bớt để chạy trong thời gian hợp lý)
+REPEATS = {'1k': 50, '100k': 20, '1m': 5}
+
+
+def skewed_index(rng, n):
+    """Chỉ số trong [0, n), nghiêng về các phần tử đầu (giống độ phổ biến thực tế)"""
+    return int(n * rng.random() ** 3)
+
+
+def generate_data(scale, seed=42):
+    """Ghi dữ liệu giả lập theo đúng định dạng JSON của project vào thư mục hiện tại"""
+    import storage
+
+    config = SCALES[scale]
+    rng = random.Random(seed)
+    now = datetime.now()
+
+    def random_time(days=30):
+        return (now - timedelta(seconds=rng.uniform(0, days * 86400))).isoformat()
+
+    products = []
+    for pid in range(1, config['products'] + 1):
+        brand = rng.choice(BRANDS)
+        products.append({
+            'id': pid,
+            'name': f"{brand} {rng.choice(['Pro', 'Air', 'Gaming', 'Slim', 'Book', 'Nitro', 'Zen'])} {pid}",
+            'brand': brand,
+            'category': rng.choice(CATEGORIES),
+            'price': rng.randrange(8000000, 60000000, 500000),
+            'description': ' '.join(rng.sample(WORDS, 8)),
+            'image': f'https://via.placeholder.com/300x200?text=Laptop+{pid}',
+            'stock': rng.randint(0, 50)
+        })
+
+    users = [{
+        'id': uid,
+        'username': f'user{uid}',
+        'password': 'bench',
+        'email': f'user{uid}@example.com',
+        'created_at': random_time(365)
+    } for uid in range(1, config['users'] + 1)]
+
+    n_views = config['events'] * 6 // 10
+    n_searches = config['events'] * 2 // 10
+    n_orders = config['events'] - n_views - n_searches
+
+    events = []
+    for _ in range(n_views):
+        events.append({'type': 'view', 'user_id': rng.randint(1, config['users']),
+                       'product_id': skewed_index(rng, config['products']) + 1, 'ts': random_time()})
+    for _ in range(n_searches):
+        events.append({'type': 'search', 'user_id': rng.randint(1, config['users']),
+                       'query': rng.choice(SEARCH_TERMS), 'ts': random_time()})
+    events.sort(key=lambda e: e['ts'])
+
+    # recent_views / search_history chỉ giữ N bản ghi mới nhất mỗi user, mới nhất trước
+    recent_views = {}
+    search_history = {}
+    for event in reversed(events):
+        key = str(event['user_id'])
+        if event['type'] == 'view':
+            views = recent_views.setdefault(key, [])
+            if len(views) < storage.RECENT_VIEWS_LIMIT and all(v['product_id'] != event['product_id'] for v in views):
+                views.append({'product_id': event['product_id'], 'viewed_at': event['ts']})
+        else:
+            searches = search_history.setdefault(key, [])
+            if len(searches) < storage.SEARCH_HISTORY_LIMIT:
+                searches.append({'query': event['query'], 'timestamp': event['ts']})
+
+    orders = []
+    for oid, created_at in enumerate(sorted(random_time() for _ in range(n_orders)), 1):
+        product = products[skewed_index(rng, len(products))]
+        quantity = rng.randint(1, 2)
+        orders.append({
+            'id': oid,
+            'user_id': rng.randint(1, config['users']),
+            'product_id': product['id'],
+            'product_name': product['name'],
+            'quantity': quantity,
+            'total_price': product['price'] * quantity,
+            'status': 'Đang xử lý',
+            'created_at': created_at
+        })
+
+    files = {
+        storage.PRODUCTS_FILE: products,
+        storage.USERS_FILE: users,
+        storage.ORDERS_FILE: orders,
+        storage.RECENT_VIEWS_FILE: recent_views,
+        storage.SEARCH_HISTORY_FILE: search_history,
+    }
+    for path, data in files.items():
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    with open('events.log', 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+def timed(fn, repeat=1):
+    """Chạy `fn()` `repeat` lần, trả về thống kê thời gian (ms)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'n': len(samples),
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+def run_scale(scale, seed=42):
+    """Sinh dữ liệu và đo các phép đo của một quy mô (chạy trong thư mục làm việc hiện tại)"""
+    rng = random.Random(seed)
+    results = {'config': SCALES[scale]}
+    repeat = REPEATS[scale]
+
+    start = time.perf_counter()
+    generate_data(scale, seed)
+    results['generate_data_s'] = round(time.perf_counter() - start, 3)
+
+    import storage
+    start = time.perf_counter()
+    storage.init_db()
+    results['migrate_s'] = round(time.perf_counter() - start, 3)
+
+    from main import app
+    from recommendation_ml import ProductRecommendationML
+
+    recommender = ProductRecommendationML()
+    recommender.load_data()
+    results['build_product_features'] = timed(recommender.build_product_features, repeat=min(repeat, 3))
+    results['build_neighbor_index'] = timed(recommender.build_neighbor_index, repeat=1)
+    recommender.save_model()
+
+    user_ids = [rng.randint(1, SCALES[scale]['users']) for _ in range(repeat)]
+    sample = iter(user_ids)
+    # Mỗi request dùng một session mới (dữ liệu người dùng không được cache giữa các lần)
+    results['get_recommendations'] = timed(
+        lambda: recommender.new_session().get_recommendations(next(sample)), repeat=repeat)
+    sample = iter(user_ids)
+    results['get_excluded_products'] = timed(
+        lambda: recommender.new_session().get_excluded_products(next(sample)), repeat=repeat)
+
+    results['get_trending_products_cold'] = timed(recommender.get_trending_products, repeat=1)
+    results['get_trending_products'] = timed(recommender.get_trending_products, repeat=repeat)
+
+    client = app.test_client()
+    queries = iter([f'{rng.choice(SEARCH_TERMS)} {rng.choice(WORDS)}' for _ in range(repeat)])
+    results['index_search'] = timed(lambda: client.get('/', query_string={'search': next(queries)}), repeat=repeat)
+
+    client.post('/login', data={'username': f'user{user_ids[0]}', 'password': 'bench'})
+    in_stock = [p['id'] for p in storage.get_products() if p['stock'] > 0]
+    products = iter(rng.choice(in_stock) for _ in range(repeat))
+    results['order'] = timed(lambda: client.post(f'/order/{next(products)}', data={'quantity': 1}),
+                             repeat=repeat)
+    return results
+
+
+def run_scale_subprocess(scale, seed, keep_dir=False):
+    workdir = tempfile.mkdtemp(prefix=f'bench-{scale}-')
+    result_file = os.path.join(workdir, 'result.json')
+    try:
+        env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        proc = subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, 'benchmark.py'),
+             '--worker', scale, '--seed', str(seed), '--result', result_file],
+            cwd=workdir, env=env, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(proc.stdout[-2000:])
+            print(proc.stderr[-4000:])
+            return {'error': f'exit code {proc.returncode}'}
+        with open(result_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        if keep_dir:
+            print(f"Dữ liệu của quy mô {scale}: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """In tỉ lệ median so với báo cáo cũ, trả về danh sách phép đo chậm hơn `threshold` lần"""
+    regressions = []
+    for scale, results in report['scales'].items():
+        old = baseline.get('scales', {}).get(scale, {})
+        for name, stats in results.items():
+            if not isinstance(stats, dict) or 'median_ms' not in stats or name not in old:
+                continue
+            ratio = stats['median_ms'] / old[name]['median_ms'] if old[name]['median_ms'] else 1.0
+            flag = ' <-- chậm hơn' if ratio > threshold else ''
+            print(f"{scale:>5} {name:<28} {old[name]['median_ms']:>10.3f} -> {stats['median_ms']:>10.3f} ms "
+                  f"(x{ratio:.2f}){flag}")
+            if ratio > threshold:
+                regressions.append((scale, name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark recommender và các route Flask')
+    parser.add_argument('--scales', default='1k', help=f"Các quy mô, phân cách bằng dấu phẩy ({', '.join(SCALES)})")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_report.json')
+    parser.add_argument('--compare', help='Báo cáo cũ để so sánh')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Median chậm hơn bao nhiêu lần thì coi là regression (mặc định 1.2)')
+    parser.add_argument('--keep-data', action='store_true', help='Giữ lại thư mục dữ liệu giả lập')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        results = run_scale(args.worker, args.seed)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+        return 0
+
+    scales = [s.strip() for s in args.scales.split(',') if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"Quy mô không hợp lệ: {', '.join(unknown)}")
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'scales': {}
+    }
+    for scale in scales:
+        print(f"Đang chạy quy mô {scale}...")
+        report['scales'][scale] = run_scale_subprocess(scale, args.seed, args.keep_data)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Đã ghi báo cáo vào '{args.output}'")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+import storage
+from metrics import stage
+from search_index import SearchIndex
+
+# Kiểm tra version / stock_seq trong database tối đa mỗi CATALOG_CHECK_SECONDS giây (không phải mỗi lần đọc)
+CATALOG_CHECK_SECONDS = float(os.environ.get('CATALOG_CHECK_SECONDS', 1))
+
+
+class ProductCatalog:
+    """Catalog sản phẩm trong bộ nhớ, index theo id, brand và category.
+
+    Load lại toàn bộ khi `catalog_version` trong database thay đổi (thêm/sửa sản phẩm).
+    Đổi stock (đặt hàng) chỉ tăng `stock_seq`: các hàng có stock_seq mới được đọc lại và
+    cập nhật tại chỗ, nên các worker process khác cũng thấy stock mới mà không load lại catalog.
+    `availability_version` tăng khi có sản phẩm chuyển giữa còn hàng / hết hàng.
+    Thay đổi từ process khác được thấy sau tối đa `check_interval` giây; process vừa ghi
+    gọi `refresh(force=True)` để thấy ngay.
+    """
+
+    def __init__(self, check_interval=CATALOG_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._version = None
+        self._stock_seq = None
+        self.availability_version = 0
+        self.products = []
+        self.by_id = {}
+        self.by_brand = {}
+        self.by_category = {}
+        self.search_index = SearchIndex()
+
+    def _build(self, products, version, stock_seq):
+        by_id = {}
+        by_brand = {}
+        by_category = {}
+        for product in products:
+            by_id[product['id']] = product
+            by_brand.setdefault(product['brand'], []).append(product['id'])
+            by_category.setdefault(product['category'], []).append(product['id'])
+
+        # Chỉ index lại những sản phẩm có name/brand/category/description thay đổi
+        self.search_index.sync(products)
+
+        # Gán cuối cùng để thread đang đọc luôn thấy một bộ index nhất quán
+        self.products, self.by_id, self.by_brand, self.by_category = products, by_id, by_brand, by_category
+        self._version = version
+        self._stock_seq = stock_seq
+        self.availability_version += 1
+
+    def _apply_stock_changes(self, changes, stock_seq):
+        """Ghi stock mới vào các dict sản phẩm đang dùng (cache danh sách / gợi ý thấy ngay)"""
+        flipped = False
+        for row in changes:
+            product = self.by_id.get(row['id'])
+            if product is None:
+                continue
+            flipped |= (product['stock'] > 0) != (row['stock'] > 0)
+            product['stock'] = row['stock']
+            stock_seq = max(stock_seq, row['stock_seq'])
+        self._stock_seq = stock_seq
+        if flipped:
+            self.availability_version += 1
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._version is not None and now - self._checked_at < self.check_interval:
+            return self
+
+        version, stock_seq = storage.get_catalog_state()
+        self._checked_at = now
+        if version == self._version and stock_seq == self._stock_seq:
+            return self
+
+        with self._lock:
+            if version != self._version:
+                with stage('catalog_load'):
+                    self._build(storage.get_products(), version, stock_seq)
+            elif stock_seq != self._stock_seq:
+                self._apply_stock_changes(storage.get_stock_changes(self._stock_seq), stock_seq)
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    @property
+    def version(self):
+        """Version nội dung: chỉ đổi khi thêm/sửa sản phẩm, không đổi khi đặt hàng"""
+        return self.refresh()._version
+
+    def all(self):
+        return self.refresh().products
+
+    def get(self, product_id):
+        return self.refresh().by_id.get(product_id)
+
+    def get_many(self, product_ids):
+        by_id = self.refresh().by_id
+        return [by_id[pid] for pid in product_ids if pid in by_id]
+
+    def ids_by_brand(self, brand):
+        return self.refresh().by_brand.get(brand, [])
+
+    def ids_by_category(self, category):
+        return self.refresh().by_category.get(category, [])
+
+    def search(self, query, limit=None, with_scores=False):
+        """Sản phẩm khớp query, xếp theo độ liên quan; `with_scores` trả về [(sản phẩm, điểm)]"""
+        by_id = self.refresh().by_id
+        ranked = self.search_index.search(query)
+        if limit:
+            ranked = ranked[:limit]
+        if with_scores:
+            return [(by_id[pid], score) for pid, score in ranked if pid in by_id]
+        return [by_id[pid] for pid, _ in ranked if pid in by_id]
+
+    def suggest(self, prefix, limit=10):
+        return self.refresh().search_index.suggest(prefix, limit=limit)
+
+    def brands(self):
+        return sorted(self.refresh().by_brand)
+
+    def categories(self):
+        return sorted(self.refresh().by_category)
+
+
+catalog = ProductCatalog()
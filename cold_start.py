@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import Counter
+
+import storage
+from catalog import catalog
+
+# Đơn hàng mới chỉ làm đổi thứ tự 'popular': đọc lại tối đa mỗi POPULAR_REFRESH_SECONDS giây
+POPULAR_REFRESH_SECONDS = float(os.environ.get('POPULAR_REFRESH_SECONDS', 60))
+
+
+class ColdStartRankings:
+    """Danh sách gợi ý cho user chưa có lượt click, tính sẵn một lần cho mỗi catalog version.
+
+    - 'price_band': sản phẩm còn hàng, giá gần giá trung bình nhất trước
+    - 'popular': sản phẩm còn hàng, bán được nhiều nhất trước (hoà thì theo price_band)
+    - by_category: thứ tự 'popular' trong từng category
+
+    Tính lại khi nội dung catalog đổi hoặc có sản phẩm chuyển còn hàng / hết hàng, và khi có
+    đơn mới (kiểm tra tối đa mỗi `refresh_interval` giây, không phải mỗi lần đặt hàng);
+    số lượng bán được cộng dồn từ các đơn mới theo id tăng dần.
+    """
+
+    STRATEGIES = ('price_band', 'popular')
+
+    def __init__(self, refresh_interval=POPULAR_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self._order_counts = Counter()
+        self._last_order_id = 0
+        self.price_band = []
+        self.popular = []
+        self.by_category = {}
+
+    def _count_new_orders(self):
+        """Cộng dồn các đơn mới; True nếu có đơn mới"""
+        self._checked_at = time.monotonic()
+        orders = storage.get_orders_after(self._last_order_id)
+        for order in orders:
+            self._order_counts[order['product_id']] += order['quantity']
+            self._last_order_id = order['id']
+        return bool(orders)
+
+    def _build(self, version):
+        in_stock = [p for p in catalog.all() if p['stock'] > 0]
+        price_band = []
+        if in_stock:
+            avg_price = sum(p['price'] for p in in_stock) / len(in_stock)
+            price_band = [p['id'] for p in sorted(in_stock, key=lambda x: abs(x['price'] - avg_price))]
+
+        # sorted ổn định: cùng số lượng bán thì giữ thứ tự price_band
+        popular = sorted(price_band, key=lambda pid: -self._order_counts[pid])
+        by_category = {}
+        category_of = {p['id']: p['category'] for p in in_stock}
+        for pid in popular:
+            by_category.setdefault(category_of[pid], []).append(pid)
+
+        self.price_band, self.popular, self.by_category = price_band, popular, by_category
+        self._version = version
+
+    def refresh(self):
+        version = (catalog.version, catalog.availability_version)
+        stale = time.monotonic() - self._checked_at >= self.refresh_interval
+        if version == self._version and not stale:
+            return self
+
+        with self._lock:
+            if version != self._version:
+                self._count_new_orders()
+                self._build(version)
+            elif time.monotonic() - self._checked_at >= self.refresh_interval and self._count_new_orders():
+                self._build(version)
+        return self
+
+    def ranked_ids(self, strategy='price_band', category=None):
+        self.refresh()
+        if category is not None:
+            return self.by_category.get(category, [])
+        return self.popular if strategy == 'popular' else self.price_band
+
+    def top(self, n=6, strategy='price_band', category=None, exclude=()):
+        """n sản phẩm đầu danh sách ('popular' theo `category` nếu có), bỏ qua các id trong `exclude`"""
+        result = []
+        for pid in self.ranked_ids(strategy, category):
+            if len(result) >= n:
+                break
+            if pid in exclude:
+                continue
+            product = catalog.get(pid)
+            if product:
+                result.append(product)
+        return result
+
+
+cold_start = ColdStartRankings()
@@ -0,0 +1,143 @@
+"""Láng giềng đồng xuất hiện (item-item) từ lượt xem và đơn hàng.
+
+Tính offline, không chạy trong web worker: đặt cron chạy `python cooccurrence.py` (vd. mỗi giờ).
+Kết quả ghi nguyên tử vào `<thư mục model>/cooccurrence.npz`; các worker thấy file đổi mtime thì
+chỉ nạp lại ba mảng này, không phải load lại model.
+"""
+import argparse
+import math
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from scipy.sparse import coo_matrix
+
+import storage
+from analytics import to_epoch
+from event_log import event_log
+from trending import DAY, ORDER_WEIGHT
+
+COOCCURRENCE_FILE = 'cooccurrence.npz'
+HALF_LIFE = 30 * DAY
+# Tương tác cũ hơn HORIZON_HALF_LIVES chu kỳ bán rã (trọng số < 1/64) không được đọc lại
+HORIZON_HALF_LIVES = 6
+
+
+def load_interactions(since):
+    """(user_id, product_id, epoch, trọng số) của lượt xem trong event log và đơn hàng từ `since` (epoch)"""
+    interactions = []
+    for event in event_log.replay(since=since):
+        if event.get('type') == 'view':
+            ts = to_epoch(event.get('ts'))
+            if ts is not None and ts >= since:
+                interactions.append((event['user_id'], event['product_id'], ts, 1.0))
+
+    for order in storage.get_orders_since(datetime.fromtimestamp(since).isoformat()):
+        ts = to_epoch(order['created_at'])
+        if ts is not None:
+            interactions.append((order['user_id'], order['product_id'], ts, float(ORDER_WEIGHT)))
+    return interactions
+
+
+def build_cooccurrence(interactions, k=20, window=10, half_life=HALF_LIFE, now=None):
+    """Ma trận item × item từ chuỗi tương tác của từng user, cắt còn top-K mỗi hàng.
+
+    Hai sản phẩm cách nhau không quá `window` bước trong chuỗi của một user được tính một lần
+    đồng xuất hiện, trọng số sqrt(w_a * w_b) với w giảm theo hàm mũ theo tuổi (chu kỳ bán rã
+    `half_life`). Điểm được chuẩn hoá kiểu cosine: C_ab / sqrt(N_a * N_b), N là tổng trọng số
+    của từng sản phẩm. Trả về (product_ids, neighbor_ids, neighbor_scores) cùng định dạng
+    với chỉ mục láng giềng nội dung.
+    """
+    now = now or time.time()
+    if not interactions:
+        return (np.empty(0, dtype=np.int64), np.empty((0, k), dtype=np.int32),
+                np.empty((0, k), dtype=np.float32))
+
+    users, pids, ts, base_weights = (np.array(col) for col in zip(*interactions))
+    order = np.lexsort((ts, users))
+    users, pids, ts, base_weights = users[order], pids[order], ts[order], base_weights[order]
+
+    product_ids, items = np.unique(pids, return_inverse=True)
+    weights = base_weights * np.exp(-math.log(2) * np.maximum(now - ts, 0) / half_life)
+    n_items = len(product_ids)
+
+    # Ghép các cặp cách nhau d bước cho mọi user cùng lúc, d = 1..window
+    rows, cols, vals = [], [], []
+    for d in range(1, min(window, len(items) - 1) + 1):
+        same = (users[d:] == users[:-d]) & (items[d:] != items[:-d])
+        a, b = items[:-d][same], items[d:][same]
+        w = np.sqrt(weights[:-d][same] * weights[d:][same])
+        rows += [a, b]
+        cols += [b, a]
+        vals += [w, w]
+
+    item_weights = np.bincount(items, weights=weights, minlength=n_items)
+    neighbor_ids = np.full((n_items, k), -1, dtype=np.int32)
+    neighbor_scores = np.zeros((n_items, k), dtype=np.float32)
+    if not rows:
+        return product_ids.astype(np.int64), neighbor_ids, neighbor_scores
+
+    counts = coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                        shape=(n_items, n_items)).tocsr()
+    counts.sum_duplicates()
+
+    norms = np.sqrt(np.maximum(item_weights, 1e-12))
+    row_of = np.repeat(np.arange(n_items), np.diff(counts.indptr))
+    scores = (counts.data / (norms[row_of] * norms[counts.indices])).astype(np.float32)
+
+    # Cắt còn top-K mỗi hàng: sắp theo (hàng, điểm giảm dần) bằng một khoá float
+    # hàng - điểm / (2 * điểm lớn nhất) (nhanh hơn lexsort nhiều lần), giữ K phần tử đầu của mỗi hàng
+    order = np.argsort(row_of - scores / (2.0 * max(float(scores.max()), 1e-12)))
+    rank = np.arange(len(order)) - counts.indptr[row_of[order]]
+    top = order[rank < k]
+    neighbor_ids[row_of[top], rank[rank < k]] = product_ids[counts.indices[top]]
+    neighbor_scores[row_of[top], rank[rank < k]] = scores[top]
+
+    return product_ids.astype(np.int64), neighbor_ids, neighbor_scores
+
+
+def save_cooccurrence(path, product_ids, neighbor_ids, neighbor_scores):
+    """Ghi ra file tạm rồi đổi tên: worker đang đọc không bao giờ thấy file ghi dở"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, product_ids=product_ids, neighbor_ids=neighbor_ids,
+                 neighbor_scores=neighbor_scores, built_at=np.array(time.time()))
+    os.replace(tmp_path, path)
+
+
+def load_cooccurrence(path):
+    """(product_ids, neighbor_ids, neighbor_scores, built_at) hoặc None nếu chưa có file"""
+    try:
+        with np.load(path) as data:
+            return (data['product_ids'], data['neighbor_ids'], data['neighbor_scores'],
+                    float(data['built_at']))
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Lỗi khi đọc '{path}': {e}")
+        return None
+
+
+def rebuild(model_dir, k=20, window=10, half_life=HALF_LIFE):
+    now = time.time()
+    interactions = load_interactions(since=now - HORIZON_HALF_LIVES * half_life)
+    product_ids, neighbor_ids, neighbor_scores = build_cooccurrence(
+        interactions, k=k, window=window, half_life=half_life, now=now)
+
+    os.makedirs(model_dir, exist_ok=True)
+    path = os.path.join(model_dir, COOCCURRENCE_FILE)
+    save_cooccurrence(path, product_ids, neighbor_ids, neighbor_scores)
+    print(f"Đã tính đồng xuất hiện cho {len(product_ids)} sản phẩm từ {len(interactions)} tương tác "
+          f"({time.time() - now:.2f}s), lưu vào '{path}'")
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tính lại láng giềng đồng xuất hiện (chạy bằng cron)')
+    parser.add_argument('--model-dir', default='recommendation_model')
+    parser.add_argument('--k', type=int, default=20, help='số láng giềng giữ lại mỗi sản phẩm')
+    parser.add_argument('--window', type=int, default=10, help='khoảng cách tối đa trong chuỗi tương tác')
+    parser.add_argument('--half-life-days', type=float, default=HALF_LIFE / DAY)
+    args = parser.parse_args()
+
+    rebuild(args.model_dir, k=args.k, window=args.window, half_life=args.half_life_days * DAY)
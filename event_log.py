@@ -0,0 +1,320 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+import storage
+from metrics import stage
+
+EVENT_LOG_FILE = 'events.log'
+
+# Lượt xem trong khoảng này (giây) sau một lần tìm kiếm được tính là click từ kết quả tìm kiếm
+SEARCH_CLICK_WINDOW = 600
+
+
+class EventLog:
+    """Log append-only (mỗi dòng một JSON) cho lượt xem và tìm kiếm.
+
+    Request chỉ đưa sự kiện vào hàng đợi giới hạn `max_queue`; một worker thread nền ghi theo lô
+    (một lần write + một lần fsync cho cả lô), sau đó gộp vào bảng recent_views / search_history
+    trong một transaction. Khi gộp, các sự kiện của cùng một user được rút gọn trước (mỗi sản phẩm
+    chỉ giữ lượt xem mới nhất, mỗi user chỉ giữ N bản ghi gần nhất).
+
+    Khi hàng đợi đầy, `drop_policy` quyết định: 'drop_oldest' bỏ sự kiện cũ nhất trong hàng đợi,
+    'drop_newest' bỏ sự kiện mới, 'block' chờ tối đa `block_timeout` giây rồi bỏ sự kiện mới.
+    """
+
+    DROP_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, log_file=EVENT_LOG_FILE, batch_size=100, flush_interval=1.0,
+                 max_bytes=64 * 1024 * 1024, max_queue=10000, drop_policy='drop_oldest',
+                 block_timeout=0.1):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f"drop_policy không hợp lệ: {drop_policy}")
+
+        self.log_file = log_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._queue = deque()
+        self._inflight = []
+        self._worker = None
+        self._worker_pid = None
+        self._stopping = False
+
+    def _ensure_worker(self):
+        # Thread không còn sau khi fork (vd. gunicorn --preload): tạo lại trong process con
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._stopping = False
+                self._worker = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def append(self, event):
+        """Đưa sự kiện vào hàng đợi, trả về False nếu sự kiện bị bỏ vì hàng đợi đầy"""
+        self._ensure_worker()
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.drop_policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.drop_policy == 'block' and self._cond.wait_for(
+                        lambda: len(self._queue) < self.max_queue, timeout=self.block_timeout):
+                    pass
+                else:
+                    self.dropped += 1
+                    return False
+
+            self._queue.append(event)
+            self._cond.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._stopping)
+                if self._stopping:
+                    return
+
+                # Gom thêm đến khi đủ lô hoặc hết flush_interval kể từ sự kiện đầu tiên
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            try:
+                self.flush()
+            except Exception as e:
+                # Worker không được chết: lô lỗi vẫn nằm trong log file nếu đã ghi được
+                print(f"Lỗi khi ghi event log: {e}")
+
+    def close(self):
+        """Dừng worker và ghi nốt mọi sự kiện còn trong hàng đợi (gọi khi tắt process)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._worker is not None and self._worker_pid == os.getpid():
+            self._worker.join(timeout=5)
+        self.flush()
+
+    def record_view(self, user_id, product_id, viewed_at=None):
+        self.append({
+            'type': 'view',
+            'user_id': user_id,
+            'product_id': product_id,
+            'ts': viewed_at or datetime.now().isoformat()
+        })
+
+    def record_search(self, user_id, query, timestamp=None):
+        self.append({
+            'type': 'search',
+            'user_id': user_id,
+            'query': query,
+            'ts': timestamp or datetime.now().isoformat()
+        })
+
+    def flush(self):
+        """Ghi ngay mọi sự kiện đang trong hàng đợi"""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                    self._inflight = batch
+                    self._cond.notify_all()
+
+                if not batch:
+                    return
+
+                try:
+                    with stage('event_log'):
+                        self._write_batch(batch)
+                        self._compact_batch(batch)
+                finally:
+                    with self._lock:
+                        self._inflight = []
+
+    def _write_batch(self, batch):
+        data = ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in batch)
+
+        # O_APPEND + một lần write cho cả lô: các process cùng ghi không chen dòng vào nhau
+        with open(self.log_file, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+
+        if size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        rotated = f"{os.path.splitext(self.log_file)[0]}-{datetime.now():%Y%m%d%H%M%S%f}.log"
+        try:
+            os.replace(self.log_file, rotated)
+        except FileNotFoundError:
+            # Process khác vừa rotate
+            pass
+
+    @staticmethod
+    def _coalesce(events, key, limit):
+        """Rút gọn theo user: bỏ sự kiện trùng `key` cũ hơn, mỗi user giữ `limit` sự kiện mới nhất"""
+        seen = set()
+        per_user = Counter()
+        kept = []
+        for event in reversed(events):
+            k = key(event)
+            if k in seen or per_user[event['user_id']] >= limit:
+                continue
+            seen.add(k)
+            per_user[event['user_id']] += 1
+            kept.append(event)
+        return kept[::-1]
+
+    def _compact_batch(self, batch):
+        views = self._coalesce([e for e in batch if e['type'] == 'view'],
+                               lambda e: (e['user_id'], e['product_id']), storage.RECENT_VIEWS_LIMIT)
+        # Mỗi lần search là một bản ghi riêng (key = id đối tượng), chỉ giới hạn số lượng mỗi user
+        searches = self._coalesce([e for e in batch if e['type'] == 'search'],
+                                  id, storage.SEARCH_HISTORY_LIMIT)
+        if views:
+            storage.record_views([(e['user_id'], e['product_id'], e['ts']) for e in views])
+        if searches:
+            storage.add_searches([(e['user_id'], e['query'], e['ts']) for e in searches])
+
+    def pending(self, event_type, user_id=None):
+        """Sự kiện chưa gộp vào database (kể cả lô đang flush), cũ nhất trước"""
+        with self._lock:
+            return [e for e in self._inflight + list(self._queue)
+                    if e['type'] == event_type and (user_id is None or e['user_id'] == user_id)]
+
+    def get_recent_views(self, user_id, limit=storage.RECENT_VIEWS_LIMIT):
+        """Lượt xem gần nhất của user, gồm cả những lượt chưa flush"""
+        views = storage.get_recent_views(user_id, limit=limit)
+        for event in self.pending('view', user_id):
+            views = [v for v in views if v['product_id'] != event['product_id']]
+            views.insert(0, {
+                'product_id': event['product_id'],
+                'viewed_at': event['ts'],
+                'viewed_ts': datetime.fromisoformat(event['ts']).timestamp()
+            })
+        return views[:limit]
+
+    def get_search_times(self, user_id, limit=20):
+        """Thời điểm (epoch) các lần tìm kiếm gần nhất của user, gồm cả những lần chưa flush"""
+        pending = [datetime.fromisoformat(e['ts']).timestamp() for e in self.pending('search', user_id)]
+        return (pending[::-1] + storage.get_search_times(user_id, limit=limit))[:limit]
+
+    def replay(self, since=None):
+        """Đọc lại toàn bộ sự kiện đã ghi (các file đã rotate trước, file hiện tại sau).
+
+        `since` (epoch): bỏ qua các file rotate ghi lần cuối trước thời điểm này (mọi sự kiện trong đó đều cũ hơn).
+        """
+        base = os.path.splitext(self.log_file)[0]
+        for path in sorted(glob.glob(f'{base}-*.log')) + [self.log_file]:
+            if not os.path.exists(path):
+                continue
+            if since is not None and path != self.log_file and os.path.getmtime(path) < since:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Dòng ghi dở khi process bị kill
+                        continue
+
+
+class EventLogTailer:
+    """Đọc tiếp các sự kiện mới được ghi vào log (kể cả do process khác ghi), nhớ vị trí đã đọc.
+
+    Lần đọc đầu tiên đọc lại cả các file đã rotate (giới hạn `history` giây gần nhất nếu có),
+    nên bộ đếm không mất lịch sử khi process khởi động lại. Giữa hai lần đọc log có thể bị
+    rotate nhiều lần: đọc nốt file cũ rồi lần lượt mọi file rotate sau nó, theo thứ tự thời gian.
+    """
+
+    def __init__(self, log_file=EVENT_LOG_FILE, history=None):
+        self.log_file = log_file
+        self.history = history
+        self._started = False
+        self._inode = None
+        self._offset = 0
+        # File rotate mới nhất đã đọc hết (tên file chứa thời điểm rotate nên sắp xếp theo tên là theo thời gian)
+        self._last_rotated = None
+
+    def _read_from(self, path, offset):
+        events = []
+        with open(path, 'r', encoding='utf-8') as f:
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                # Dòng chưa ghi xong: đọc lại ở lần sau
+                if not line.endswith('\n'):
+                    break
+                offset = f.tell()
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+        return events, offset
+
+    def _rotated_files(self):
+        base = os.path.splitext(self.log_file)[0]
+        return sorted(glob.glob(f'{base}-*.log'))
+
+    def read_new(self):
+        try:
+            inode = os.stat(self.log_file).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        events = []
+        pending = []
+        if not self._started:
+            # Lần đầu: đọc lại lịch sử trong các file đã rotate
+            self._started = True
+            pending = self._rotated_files()
+            if self.history is not None:
+                since = time.time() - self.history
+                pending = [path for path in pending if os.path.getmtime(path) >= since]
+        elif inode != self._inode:
+            # File đã bị rotate (một hoặc nhiều lần): đọc nốt file cũ, rồi các file rotate sau nó
+            rotated = self._rotated_files()
+            pending = [path for path in rotated if self._last_rotated is None or path > self._last_rotated]
+            for i, path in enumerate(pending):
+                if self._inode is not None and os.stat(path).st_ino == self._inode:
+                    events, _ = self._read_from(path, self._offset)
+                    self._last_rotated = path
+                    pending = pending[i + 1:]
+                    break
+            self._offset = 0
+
+        for path in pending:
+            events.extend(self._read_from(path, 0)[0])
+            self._last_rotated = path
+
+        self._inode = inode
+        if inode is not None:
+            new_events, self._offset = self._read_from(self.log_file, self._offset)
+            events.extend(new_events)
+        return events
+
+
+# Cấu hình hàng đợi qua biến môi trường
+event_log = EventLog(max_queue=int(os.environ.get('EVENT_QUEUE_SIZE', 10000)),
+                     drop_policy=os.environ.get('EVENT_DROP_POLICY', 'drop_oldest'))
+atexit.register(event_log.close)
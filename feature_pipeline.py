@@ -0,0 +1,109 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from metrics import stage
+
+# Số process khi train, mặc định bằng số core; catalog nhỏ hơn ngưỡng thì fit một process như cũ
+TRAIN_WORKERS = int(os.environ.get('RECOMMENDER_TRAIN_WORKERS', 0)) or os.cpu_count() or 1
+PARALLEL_MIN_PRODUCTS = int(os.environ.get('RECOMMENDER_PARALLEL_MIN_PRODUCTS', 20000))
+
+# Tham số tách token của TfidfVectorizer mà CountVectorizer cũng nhận (trừ max_features: chọn ở bước gộp)
+COUNT_PARAMS = ('lowercase', 'strip_accents', 'token_pattern', 'ngram_range', 'analyzer',
+                'stop_words', 'preprocessor', 'tokenizer', 'encoding', 'decode_error', 'binary')
+
+
+def count_shard(texts, count_params):
+    """Chạy trong process con: ma trận đếm token của một shard với vocabulary riêng của shard"""
+    counter = CountVectorizer(dtype=np.int64, **count_params)
+    try:
+        counts = counter.fit_transform(texts)
+    except ValueError:
+        # Shard toàn text rỗng / không có token
+        return csr_matrix((len(texts), 0), dtype=np.int64), []
+    return counts.tocsr(), counter.get_feature_names_out().tolist()
+
+
+def fit_transform_sharded(vectorizer, texts, n_workers=TRAIN_WORKERS, shard_size=None):
+    """Tương đương vectorizer.fit_transform(texts) nhưng đếm token song song theo shard.
+
+    1. Chia texts thành shard, mỗi process đếm token với vocabulary cục bộ.
+    2. Gộp vocabulary: chọn `max_features` từ có tổng tần suất cao nhất toàn catalog.
+    3. Đổi cột cục bộ sang cột toàn cục, ghép các shard thành một ma trận CSR.
+    4. Tính IDF trên toàn bộ ma trận (smooth_idf như sklearn), nhân và chuẩn hoá L2.
+
+    Gán vocabulary_ và idf_ cho `vectorizer` (transform các text mới như bình thường).
+    Trả về (ma trận TF-IDF, tỉ lệ token ngoài vocabulary, thời gian từng giai đoạn theo giây).
+    """
+    timings = {}
+    n_workers = max(1, min(n_workers, len(texts)))
+    shard_size = shard_size or max(1000, -(-len(texts) // (n_workers * 4)))
+    shards = [texts[start:start + shard_size] for start in range(0, len(texts), shard_size)]
+    params = vectorizer.get_params()
+    count_params = {name: params[name] for name in COUNT_PARAMS if name in params}
+
+    start = time.perf_counter()
+    with stage('train_tokenize'):
+        if n_workers > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                results = list(pool.map(count_shard, shards, [count_params] * len(shards)))
+        else:
+            results = [count_shard(shard, count_params) for shard in shards]
+    timings['tokenize'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with stage('train_merge'):
+        terms = sorted({term for _, shard_terms in results for term in shard_terms})
+        term_index = {term: i for i, term in enumerate(terms)}
+
+        term_counts = np.zeros(len(terms), dtype=np.int64)
+        local_to_global = []
+        for counts, shard_terms in results:
+            mapping = np.fromiter((term_index[term] for term in shard_terms), dtype=np.int64, count=len(shard_terms))
+            np.add.at(term_counts, mapping, np.asarray(counts.sum(axis=0)).ravel())
+            local_to_global.append(mapping)
+
+        # Như CountVectorizer: giữ max_features từ nhiều nhất, cột theo thứ tự chữ cái
+        keep = np.arange(len(terms))
+        if vectorizer.max_features is not None and len(terms) > vectorizer.max_features:
+            keep = np.sort(np.argsort(-term_counts, kind='stable')[:vectorizer.max_features])
+        column_of = np.full(len(terms), -1, dtype=np.int64)
+        column_of[keep] = np.arange(len(keep))
+
+        matrices = []
+        for (counts, _), mapping in zip(results, local_to_global):
+            columns = column_of[mapping][counts.indices] if len(mapping) else counts.indices
+            kept = columns >= 0
+            row_of = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+            matrices.append(csr_matrix(
+                (counts.data[kept].astype(np.float64), (row_of[kept], columns[kept])),
+                shape=(counts.shape[0], len(keep))
+            ))
+        vectors = vstack(matrices).tocsr() if matrices else csr_matrix((0, len(keep)))
+    timings['merge'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with stage('train_idf'):
+        n_docs = vectors.shape[0]
+        df = np.bincount(vectors.indices, minlength=len(keep))
+        idf = np.log((1 + n_docs) / (1 + df)) + 1 if vectorizer.smooth_idf else np.log(n_docs / df) + 1
+        if vectorizer.sublinear_tf:
+            np.log(vectors.data, out=vectors.data)
+            vectors.data += 1
+        if vectorizer.use_idf:
+            vectors.data *= idf[vectors.indices]
+        if vectorizer.norm:
+            vectors = normalize(vectors, norm=vectorizer.norm, copy=False)
+    timings['idf'] = time.perf_counter() - start
+
+    vectorizer.vocabulary_ = {terms[i]: column for column, i in enumerate(keep.tolist())}
+    vectorizer.idf_ = idf
+
+    total = term_counts.sum()
+    oov_rate = 1 - term_counts[keep].sum() / total if total else 0.0
+    return vectors, float(oov_rate), timings
@@ -1,13 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response
+from markupsafe import Markup
+import hashlib
 import json
 import os
+import sqlite3
 from datetime import datetime
 from functools import wraps
 
-from recommendation_ml import get_ml_recommendations, save_search_query
-
-app = Flask(__name__)
+import metrics
+import storage
+from analytics import analytics
+from catalog import catalog
+from cold_start import cold_start
+from event_log import event_log
+from trending import trending
+from recommendation_ml import get_ml_recommendations, invalidate_user_recommendations, save_search_query
+from pagination import paginate, page_size
+from passwords import PasswordHasherBusy, password_hasher
+from response_cache import index_cache, recommendation_cache
+
+app = Flask(__name__, template_folder='Templates')
 app.secret_key = 'your-secret-key-here-change-in-production'
+metrics.init_app(app)
 
 # File paths
 USERS_FILE = 'users.json'
@@ -15,6 +29,13 @@ PRODUCTS_FILE = 'products.json'
 ORDERS_FILE = 'orders.json'
 RECENT_VIEWS_FILE = 'recent_views.json'
 
+# Tài khoản được vào trang admin, cấu hình qua biến môi trường (phân cách bằng dấu phẩy).
+# Mặc định không có ai: ai cũng đăng ký được tài khoản mới nên không dùng tên đoán được như 'admin'
+ADMIN_USERNAMES = set(filter(None, (name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(','))))
+
+# Số đơn hàng mỗi trang ở "Đơn hàng của tôi"
+ORDERS_PAGE_SIZE = 20
+
 
 # Initialize JSON files
 def init_files():
@@ -342,18 +363,11 @@ def init_files():
         with open(RECENT_VIEWS_FILE, 'w', encoding='utf-8') as f:
             json.dump({}, f, ensure_ascii=False, indent=2)
 
-
-# Helper functions
-def read_json(filename):
-    with open(filename, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def write_json(filename, data):
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Dữ liệu chạy trên SQLite, các file JSON chỉ dùng cho migration lần đầu
+    storage.init_db()
 
 
+# Helper functions
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -365,151 +379,242 @@ def login_required(f):
     return decorated_function
 
 
-# Helper function for recommendations
-def get_recommendations(user_id):
-    """Gợi ý sản phẩm dựa trên lịch sử xem"""
-    recent_views = read_json(RECENT_VIEWS_FILE)
-    products = read_json(PRODUCTS_FILE)
+def admin_required(f):
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if session.get('username') not in ADMIN_USERNAMES:
+            flash('Bạn không có quyền truy cập trang này', 'danger')
+            return redirect(url_for('index'))
+        return f(*args, **kwargs)
 
-    user_id_str = str(user_id)
-    if user_id_str not in recent_views or not recent_views[user_id_str]:
-        # Nếu chưa xem gì, đề xuất sản phẩm phổ biến (giá trung bình)
-        sorted_products = sorted(products, key=lambda x: abs(x['price'] - 20000000))
-        return sorted_products[:6]
+    return decorated_function
 
-    # Lấy sản phẩm đã xem gần nhất
-    last_viewed_id = recent_views[user_id_str][0]['product_id']
-    last_viewed = next((p for p in products if p['id'] == last_viewed_id), None)
 
-    if not last_viewed:
-        return products[:6]
+def get_orders_page(user_id, before_id=None, limit=None):
+    """Một trang đơn hàng mới nhất trước, kèm cursor (id đơn cuối) của trang sau"""
+    limit = limit or ORDERS_PAGE_SIZE
+    # Lấy dư một đơn để biết còn trang sau hay không
+    orders = storage.get_orders_page(user_id, before_id, limit + 1)
+    next_cursor = orders[limit - 1]['id'] if len(orders) > limit else None
+    return orders[:limit], next_cursor
 
-    # Tính điểm tương đồng cho mỗi sản phẩm
-    recommendations = []
-    for product in products:
-        if product['id'] == last_viewed_id:
-            continue
 
-        score = 0
+# Routes
+# Khoá sắp xếp duy nhất cho mỗi sản phẩm (hoà thì theo id) để phân trang theo cursor
+SORT_KEYS = {
+    'price_asc': lambda p: (p['price'], p['id']),
+    'price_desc': lambda p: (-p['price'], p['id']),
+    'name': lambda p: (p['name'], p['id']),
+}
+
+
+def get_listing(search_query, brand_filter, category_filter, sort_by):
+    """Danh sách sản phẩm của trang chủ theo tìm kiếm / bộ lọc / sắp xếp,
+    kèm khoá sắp xếp của từng sản phẩm và nhóm theo hãng"""
+    scores = {}
+    if search_query:
+        # Tìm qua inverted index, kết quả đã xếp theo độ liên quan
+        ranked = catalog.search(search_query, with_scores=True)
+        scores = {p['id']: score for p, score in ranked}
+        products = [p for p, _ in ranked]
+        if brand_filter:
+            products = [p for p in products if p['brand'] == brand_filter]
+        if category_filter:
+            products = [p for p in products if p['category'] == category_filter]
+
+    # Lọc theo hãng / loại bằng index của catalog thay vì quét toàn bộ
+    elif brand_filter and category_filter:
+        category_ids = set(catalog.ids_by_category(category_filter))
+        products = [p for p in catalog.get_many(catalog.ids_by_brand(brand_filter))
+                    if p['id'] in category_ids]
+    elif brand_filter:
+        products = catalog.get_many(catalog.ids_by_brand(brand_filter))
+    elif category_filter:
+        products = catalog.get_many(catalog.ids_by_category(category_filter))
+    else:
+        products = list(catalog.all())
 
-        # Cùng hãng: +3 điểm
-        if product['brand'] == last_viewed['brand']:
-            score += 3
+    # Sắp xếp
+    if sort_by in SORT_KEYS:
+        sort_key = SORT_KEYS[sort_by]
+    elif search_query:
+        sort_key = lambda p: (-scores[p['id']], p['id'])
+    else:
+        sort_key = lambda p: (p['id'],)
+    products.sort(key=sort_key)
+    keys = [sort_key(p) for p in products]
 
-        # Cùng loại: +3 điểm
-        if product['category'] == last_viewed['category']:
-            score += 3
+    # Nhóm sản phẩm theo hãng (chỉ khi KHÔNG có filter nào)
+    products_by_brand = {}
+    if not search_query and not brand_filter and not category_filter and not sort_by:
+        for product in products:
+            brand = product['brand']
+            if brand not in products_by_brand:
+                products_by_brand[brand] = []
+            products_by_brand[brand].append(product)
 
-        # Giá tương đương (trong khoảng ±30%): +2 điểm
-        price_diff = abs(product['price'] - last_viewed['price']) / last_viewed['price']
-        if price_diff <= 0.3:
-            score += 2
-        elif price_diff <= 0.5:
-            score += 1
+    return products, keys, products_by_brand
 
-        recommendations.append({
-            'product': product,
-            'score': score
-        })
 
-    # Sắp xếp theo điểm và lấy top 6
-    recommendations.sort(key=lambda x: x['score'], reverse=True)
-    return [r['product'] for r in recommendations[:6]]
+def cached_listing(search_query, brand_filter, category_filter, sort_by):
+    version = catalog.version
+    return index_cache.for_version(version).get_or_create(
+        ('listing', version, search_query, brand_filter, category_filter, sort_by),
+        lambda: get_listing(search_query, brand_filter, category_filter, sort_by))
 
 
-# Routes
-@app.route('/')
-def index():
-    all_products = read_json(PRODUCTS_FILE)
-    search_query = request.args.get('search', '')
-    brand_filter = request.args.get('brand', '')
-    category_filter = request.args.get('category', '')
-    sort_by = request.args.get('sort', '')
+def displayed_stock(search_query, brand_filter, category_filter, sort_by, cursor):
+    """Stock của các sản phẩm hiển thị trên trang: HTML đã cache chỉ phải render lại khi một trong số này đổi"""
+    products, keys, products_by_brand = cached_listing(search_query, brand_filter, category_filter, sort_by)
+    if products_by_brand:
+        shown = [p for brand_products in products_by_brand.values() for p in brand_products[:3]]
+    else:
+        shown, _ = paginate(products, keys, cursor)
+    return tuple(p['stock'] for p in shown)
 
-    # Start with all products
-    products = all_products.copy()
 
-    # Apply filters
-    if search_query:
-        # Lưu lịch sử tìm kiếm nếu user đã đăng nhập
-        if 'user_id' in session:
-            save_search_query(session['user_id'], search_query)
+def render_index_fragments(search_query, brand_filter, category_filter, sort_by, cursor):
+    """HTML bộ lọc và một trang danh sách sản phẩm (không phụ thuộc user nên dùng chung cache)"""
+    products, keys, products_by_brand = cached_listing(search_query, brand_filter, category_filter, sort_by)
+    page, next_cursor = paginate(products, keys, cursor)
 
-        products = [p for p in products if search_query.lower() in p['name'].lower()
-                    or search_query.lower() in p['description'].lower()]
+    next_url = None
+    if next_cursor:
+        params = {'search': search_query, 'brand': brand_filter, 'category': category_filter, 'sort': sort_by}
+        next_url = url_for('index', cursor=next_cursor, **{k: v for k, v in params.items() if v})
 
-    # Lọc theo hãng
-    if brand_filter:
-        products = [p for p in products if p['brand'] == brand_filter]
+    context = dict(products=page,
+                   total_count=len(products),
+                   next_url=next_url,
+                   products_by_brand=products_by_brand,
+                   search_query=search_query,
+                   brand_filter=brand_filter,
+                   category_filter=category_filter,
+                   sort_by=sort_by,
+                   all_brands=catalog.brands(),
+                   all_categories=catalog.categories())
+    return (Markup(render_template('partials/index_sidebar.html', **context)),
+            Markup(render_template('partials/product_listing.html', **context)))
 
-    # Lọc theo loại
-    if category_filter:
-        products = [p for p in products if p['category'] == category_filter]
 
-    # Sắp xếp
-    if sort_by == 'price_asc':
-        products.sort(key=lambda x: x['price'])
-    elif sort_by == 'price_desc':
-        products.sort(key=lambda x: x['price'], reverse=True)
-    elif sort_by == 'name':
-        products.sort(key=lambda x: x['name'])
-
-    # Lấy sản phẩm đề xuất sử dụng ML nếu user đã đăng nhập
+@app.route('/')
+def index():
+    search_query = request.args.get('search', '')
+    brand_filter = request.args.get('brand', '')
+    category_filter = request.args.get('category', '')
+    sort_by = request.args.get('sort', '')
+    cursor = request.args.get('cursor', '')
+
+    # Lưu lịch sử tìm kiếm nếu user đã đăng nhập (chỉ ở trang đầu)
+    if search_query and not cursor and 'user_id' in session:
+        save_search_query(session['user_id'], search_query)
+
+    # Cache xoá khi nội dung catalog đổi; đặt hàng chỉ làm đổi key của các trang có sản phẩm đó
+    version = catalog.version
+    key = (version, search_query, brand_filter, category_filter, sort_by, cursor,
+           displayed_stock(search_query, brand_filter, category_filter, sort_by, cursor))
+    cache = index_cache.for_version(version)
+
+    def render_page(recommended_products):
+        sidebar_html, listing_html = cache.get_or_create(
+            ('fragments',) + key,
+            lambda: render_index_fragments(search_query, brand_filter, category_filter, sort_by, cursor))
+        return render_template('index.html',
+                               sidebar_html=sidebar_html,
+                               listing_html=listing_html,
+                               search_query=search_query,
+                               brand_filter=brand_filter,
+                               category_filter=category_filter,
+                               recommended_products=recommended_products)
+
+    # Khách chưa đăng nhập: gợi ý lấy từ danh sách bán chạy tính sẵn (theo category đang lọc nếu có)
+    if 'user_id' not in session:
+        recommended_products = []
+        if not (cursor or search_query or brand_filter):
+            recommended_products = cold_start.top(6, strategy='popular', category=category_filter or None)
+
+        # Không có flash message: cả trang giống nhau, cache kèm ETag
+        if '_flashes' not in session:
+            def render_anonymous():
+                html = render_page(recommended_products)
+                return html, hashlib.md5(html.encode('utf-8')).hexdigest()
+
+            # Danh sách gợi ý cũng hiển thị stock: key theo cả id và stock
+            popular_key = tuple((p['id'], p['stock']) for p in recommended_products)
+            html, etag = cache.get_or_create(('page',) + key + (popular_key,), render_anonymous)
+            response = make_response(html)
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return render_page(recommended_products)
+
+    # Lấy sản phẩm đề xuất sử dụng ML nếu user đã đăng nhập (chỉ ở trang đầu)
     recommended_products = []
-    if 'user_id' in session:
+    if not cursor:
         try:
             recommended_products = get_ml_recommendations(session['user_id'], n=6)
         except Exception as e:
             print(f"Error getting recommendations: {e}")
             recommended_products = []
 
-    # Lấy tất cả hãng và loại để hiển thị trong filter
-    all_brands = sorted(set(p['brand'] for p in all_products))
-    all_categories = sorted(set(p['category'] for p in all_products))
+    return render_page(recommended_products)
+
+
+@app.route('/api/products')
+def api_products():
+    """Một trang sản phẩm (JSON) cho infinite scroll, cùng tham số lọc với trang chủ"""
+    products, keys, _ = cached_listing(request.args.get('search', ''),
+                                       request.args.get('brand', ''),
+                                       request.args.get('category', ''),
+                                       request.args.get('sort', ''))
+    page, next_cursor = paginate(products, keys, request.args.get('cursor', ''),
+                                 limit=page_size(request.args.get('limit', type=int)))
+    return jsonify({'products': page, 'next_cursor': next_cursor, 'total': len(products)})
+
+@app.route('/api/search/suggest')
+def search_suggest():
+    """Autocomplete cho ô tìm kiếm"""
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+
+    return jsonify({
+        'terms': catalog.suggest(query, limit=limit),
+        'products': [{'id': p['id'], 'name': p['name']} for p in catalog.search(query, limit=limit)]
+    })
 
-    # Nhóm sản phẩm theo hãng (chỉ khi KHÔNG có filter nào)
-    products_by_brand = {}
-    if not search_query and not brand_filter and not category_filter and not sort_by:
-        for product in products:
-            brand = product['brand']
-            if brand not in products_by_brand:
-                products_by_brand[brand] = []
-            products_by_brand[brand].append(product)
 
-    return render_template('index.html',
-                           products=products,
-                           products_by_brand=products_by_brand,
-                           search_query=search_query,
-                           brand_filter=brand_filter,
-                           category_filter=category_filter,
-                           sort_by=sort_by,
-                           all_brands=all_brands,
-                           all_categories=all_categories,
-                           recommended_products=recommended_products)
+@app.route('/trending')
+def trending_products():
+    window = request.args.get('window', '7d')
+    if window not in trending.windows:
+        window = '7d'
+
+    products = catalog.get_many(pid for pid, _ in trending.top(window, n=12))
+    return render_template('trending.html', products=products)
+
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password') or ''
         email = request.form.get('email')
 
-        users = read_json(USERS_FILE)
-
-        if any(u['username'] == username for u in users):
+        if storage.get_user_by_username(username):
             flash('Tên đăng nhập đã tồn tại', 'danger')
             return redirect(url_for('register'))
 
-        new_user = {
-            'id': len(users) + 1,
-            'username': username,
-            'password': password,  # Trong thực tế nên hash password
-            'email': email,
-            'created_at': datetime.now().isoformat()
-        }
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            flash('Hệ thống đang bận, vui lòng thử lại sau', 'warning')
+            return render_template('register.html'), 503
 
-        users.append(new_user)
-        write_json(USERS_FILE, users)
+        try:
+            storage.add_user(username, password_hash, email, datetime.now().isoformat())
+        except sqlite3.IntegrityError:
+            flash('Tên đăng nhập đã tồn tại', 'danger')
+            return redirect(url_for('register'))
 
         flash('Đăng ký thành công! Vui lòng đăng nhập', 'success')
         return redirect(url_for('login'))
@@ -521,12 +626,25 @@ def register():
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password') or ''
 
-        users = read_json(USERS_FILE)
-        user = next((u for u in users if u['username'] == username and u['password'] == password), None)
+        user = storage.get_user_by_username(username)
 
-        if user:
+        try:
+            valid = password_hasher.verify(user['password'] if user else None, password)
+        except PasswordHasherBusy:
+            flash('Hệ thống đang bận, vui lòng thử lại sau', 'warning')
+            return render_template('login.html'), 503
+
+        # Mật khẩu text thuần (dữ liệu cũ) hoặc thuật toán cũ: hash lại khi đăng nhập đúng.
+        # Không bắt buộc: pool đang bận thì để lần đăng nhập sau
+        if valid and password_hasher.needs_rehash(user['password']):
+            try:
+                storage.update_user_password(user['id'], password_hasher.hash(password))
+            except PasswordHasherBusy:
+                pass
+
+        if valid:
             session['user_id'] = user['id']
             session['username'] = user['username']
             flash(f'Chào mừng {username}!', 'success')
@@ -546,34 +664,16 @@ def logout():
 
 @app.route('/product/<int:product_id>')
 def product_detail(product_id):
-    products = read_json(PRODUCTS_FILE)
-    product = next((p for p in products if p['id'] == product_id), None)
+    product = catalog.get(product_id)
 
     if not product:
         flash('Không tìm thấy sản phẩm', 'danger')
         return redirect(url_for('index'))
 
-    # Save to recent views
+    # Ghi lượt xem vào event log (append, ghi xuống đĩa theo lô)
     if 'user_id' in session:
-        recent_views = read_json(RECENT_VIEWS_FILE)
-        user_id = str(session['user_id'])
-
-        if user_id not in recent_views:
-            recent_views[user_id] = []
-
-        # Remove if already exists
-        recent_views[user_id] = [v for v in recent_views[user_id] if v['product_id'] != product_id]
-
-        # Add to front
-        recent_views[user_id].insert(0, {
-            'product_id': product_id,
-            'viewed_at': datetime.now().isoformat()
-        })
-
-        # Keep only last 10
-        recent_views[user_id] = recent_views[user_id][:10]
-
-        write_json(RECENT_VIEWS_FILE, recent_views)
+        event_log.record_view(session['user_id'], product_id)
+        invalidate_user_recommendations(session['user_id'])
 
     return render_template('product_detail.html', product=product)
 
@@ -581,8 +681,7 @@ def product_detail(product_id):
 @app.route('/order/<int:product_id>', methods=['POST'])
 @login_required
 def order(product_id):
-    products = read_json(PRODUCTS_FILE)
-    product = next((p for p in products if p['id'] == product_id), None)
+    product = catalog.get(product_id)
 
     if not product:
         flash('Không tìm thấy sản phẩm', 'danger')
@@ -592,31 +691,35 @@ def order(product_id):
         flash('Sản phẩm đã hết hàng', 'warning')
         return redirect(url_for('product_detail', product_id=product_id))
 
-    quantity = int(request.form.get('quantity', 1))
+    # Mặc định 1 chỉ khi form không gửi số lượng; gửi giá trị không phải số nguyên ('abc', '', '2.5') thì từ chối
+    quantity = request.form.get('quantity', type=int) if 'quantity' in request.form else 1
+
+    if quantity is None or quantity < 1:
+        flash('Số lượng không hợp lệ', 'warning')
+        return redirect(url_for('product_detail', product_id=product_id))
 
     if quantity > product['stock']:
         flash(f'Chỉ còn {product["stock"]} sản phẩm trong kho', 'warning')
         return redirect(url_for('product_detail', product_id=product_id))
 
-    # Create order
-    orders = read_json(ORDERS_FILE)
-    new_order = {
-        'id': len(orders) + 1,
-        'user_id': session['user_id'],
-        'product_id': product_id,
-        'product_name': product['name'],
-        'quantity': quantity,
-        'total_price': product['price'] * quantity,
-        'status': 'Đang xử lý',
-        'created_at': datetime.now().isoformat()
-    }
-    orders.append(new_order)
-    write_json(ORDERS_FILE, orders)
-
-    # Update stock
-    product['stock'] -= quantity
-    write_json(PRODUCTS_FILE, products)
+    # Trừ kho và tạo đơn trong cùng một transaction (kiểm tra stock lần cuối ở database)
+    try:
+        new_order = storage.place_order(session['user_id'], product_id, quantity,
+                                        'Đang xử lý', datetime.now().isoformat())
+    except storage.OutOfStockError as e:
+        if e.available <= 0:
+            flash('Sản phẩm đã hết hàng', 'warning')
+        else:
+            flash(f'Chỉ còn {e.available} sản phẩm trong kho', 'warning')
+        return redirect(url_for('product_detail', product_id=product_id))
+
+    if new_order is None:
+        flash('Không tìm thấy sản phẩm', 'danger')
+        return redirect(url_for('index'))
 
+    # Stock vừa đổi: process này thấy ngay, không chờ lần kiểm tra định kỳ
+    catalog.refresh(force=True)
+    invalidate_user_recommendations(session['user_id'])
     flash(f'Đặt hàng thành công! Mã đơn hàng: {new_order["id"]}', 'success')
     return redirect(url_for('my_orders'))
 
@@ -624,26 +727,31 @@ def order(product_id):
 @app.route('/my-orders')
 @login_required
 def my_orders():
-    orders = read_json(ORDERS_FILE)
-    user_orders = [o for o in orders if o['user_id'] == session['user_id']]
-    user_orders.reverse()  # Newest first
-    return render_template('my_orders.html', orders=user_orders)
+    user_orders, next_cursor = get_orders_page(session['user_id'], request.args.get('cursor', type=int))
+    next_url = url_for('my_orders', cursor=next_cursor) if next_cursor else None
+    return render_template('my_orders.html', orders=user_orders, next_url=next_url)
+
+
+@app.route('/api/my-orders')
+@login_required
+def api_my_orders():
+    user_orders, next_cursor = get_orders_page(session['user_id'], request.args.get('cursor', type=int),
+                                               limit=page_size(request.args.get('limit', type=int), ORDERS_PAGE_SIZE))
+    return jsonify({'orders': user_orders, 'next_cursor': next_cursor})
 
 
 @app.route('/recent-views')
 @login_required
 def recent_views():
-    recent_views = read_json(RECENT_VIEWS_FILE)
-    user_id = str(session['user_id'])
+    user_views = event_log.get_recent_views(session['user_id'])
 
-    if user_id not in recent_views:
+    if not user_views:
         return render_template('recent_views.html', products=[])
 
-    products = read_json(PRODUCTS_FILE)
     viewed_products = []
 
-    for view in recent_views[user_id]:
-        product = next((p for p in products if p['id'] == view['product_id']), None)
+    for view in user_views:
+        product = catalog.get(view['product_id'])
         if product:
             viewed_products.append({
                 **product,
@@ -653,6 +761,35 @@ def recent_views():
     return render_template('recent_views.html', products=viewed_products)
 
 
+@app.route('/admin/analytics')
+@admin_required
+def admin_analytics():
+    # Các bộ đếm được cập nhật tăng dần, chỉ đọc phần sự kiện mới từ lần trước
+    return render_template('admin/analytics.html', analytics=analytics.report(catalog.refresh().by_id))
+
+
+
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Độ trễ theo route và theo giai đoạn, hit/miss của các cache (JSON)"""
+    return jsonify({
+        **metrics.metrics.snapshot(),
+        'caches': {'index': index_cache.stats(), 'recommendations': recommendation_cache.stats()}
+    })
+
+
+@app.route('/admin/profile')
+@admin_required
+def admin_profile():
+    """Kết quả sampling profiler dạng folded stacks (bật bằng PROFILER_INTERVAL_MS)"""
+    if metrics.profiler is None:
+        return 'Sampling profiler đang tắt (đặt biến môi trường PROFILER_INTERVAL_MS để bật)', 404
+    if request.args.get('reset'):
+        metrics.profiler.reset()
+    return metrics.profiler.folded(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
 if __name__ == '__main__':
     init_files()
     app.run(debug=True)
\ No newline at end of file
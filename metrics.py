@@ -0,0 +1,238 @@
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Cận trên (ms) của các bucket histogram
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_local = threading.local()
+
+
+class LatencyHistogram:
+    """Histogram độ trễ theo bucket cố định; percentile xấp xỉ bằng cận trên của bucket"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(float(self.buckets[i]), self.max_ms) if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': round(self.percentile(0.5), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            # [[cận trên ms, số request], ...], bucket cuối không có cận trên
+            'buckets': [[b, c] for b, c in zip(self.buckets, self.counts)] + [['inf', self.counts[-1]]]
+        }
+
+
+class Metrics:
+    """Độ trễ theo route và thời gian từng giai đoạn (db, model_load, recommend, render, ...) của request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.stages = {}
+
+    def _observe(self, table, key, ms):
+        with self._lock:
+            if key not in table:
+                table[key] = LatencyHistogram()
+            table[key].observe(ms)
+
+    def observe_route(self, endpoint, ms, stages):
+        self._observe(self.routes, endpoint, ms)
+        for stage, stage_ms in stages.items():
+            self._observe(self.stages, (endpoint, stage), stage_ms)
+
+    def observe_stage(self, stage, ms):
+        """Giai đoạn chạy ngoài request (thread nền): ghi vào route '-'"""
+        self._observe(self.stages, ('-', stage), ms)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {}
+            for (endpoint, stage), hist in sorted(self.stages.items()):
+                stages.setdefault(endpoint, {})[stage] = hist.to_dict()
+            return {
+                'routes': {endpoint: hist.to_dict() for endpoint, hist in sorted(self.routes.items())},
+                'stages': stages
+            }
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def stage(name):
+    """Cộng thời gian của khối lệnh vào giai đoạn `name` của request hiện tại.
+
+    Khối lồng nhau cùng tên chỉ được tính một lần (vd. hàm storage gọi hàm storage khác).
+    """
+    depth = getattr(_local, 'depth', None)
+    if depth is None:
+        depth = _local.depth = Counter()
+
+    depth[name] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        depth[name] -= 1
+        if depth[name] == 0:
+            ms = (time.perf_counter() - start) * 1000
+            stages = getattr(_local, 'stages', None)
+            if stages is not None:
+                stages[name] = stages.get(name, 0.0) + ms
+            else:
+                metrics.observe_stage(name, ms)
+
+
+def timed(name):
+    """Decorator: tính thời gian chạy hàm vào giai đoạn `name`"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    """Lấy mẫu stack của các thread đang xử lý request mỗi `interval` giây.
+
+    Kết quả ở dạng "folded stacks" (route;hàm ngoài;...;hàm trong số_mẫu), mở được bằng
+    flamegraph.pl hoặc speedscope. Chi phí không phụ thuộc vào số lời gọi hàm như cProfile.
+    """
+
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.active = {}  # thread id -> endpoint
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            active = dict(self.active)
+            if not active:
+                continue
+
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, endpoint in active.items():
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                        frame = frame.f_back
+                    if stack:
+                        self.samples[';'.join([endpoint] + stack[::-1])] += 1
+
+    def folded(self):
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common())
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+
+profiler = None
+
+
+def init_app(app):
+    """Đo mọi request của `app`: tổng thời gian theo route, các giai đoạn, thời gian render template.
+
+    Bật sampling profiler bằng biến môi trường PROFILER_INTERVAL_MS (vd. 5).
+    """
+    global profiler
+    from flask import before_render_template, g, request, template_rendered
+
+    interval_ms = os.environ.get('PROFILER_INTERVAL_MS')
+    if interval_ms and profiler is None:
+        profiler = SamplingProfiler(interval=float(interval_ms) / 1000)
+        profiler.start()
+
+    @app.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+        _local.stages = {}
+        _local.depth = Counter()
+        if profiler is not None:
+            profiler.active[threading.get_ident()] = request.endpoint or '-'
+
+    @app.after_request
+    def finish_request(response):
+        start = g.pop('request_start', None)
+        stages = getattr(_local, 'stages', None) or {}
+        _local.stages = None
+        if profiler is not None:
+            profiler.active.pop(threading.get_ident(), None)
+        if start is None:
+            return response
+
+        total_ms = (time.perf_counter() - start) * 1000
+        metrics.observe_route(request.endpoint or '-', total_ms, stages)
+
+        # Hiển thị trong tab Network của trình duyệt
+        timings = [f'{name};dur={ms:.2f}' for name, ms in stages.items()]
+        response.headers['Server-Timing'] = ', '.join(timings + [f'total;dur={total_ms:.2f}'])
+        return response
+
+    @app.teardown_request
+    def cleanup_request(exc):
+        # Request lỗi không qua after_request
+        _local.stages = None
+        if profiler is not None:
+            profiler.active.pop(threading.get_ident(), None)
+
+    def on_before_render(sender, template, context, **extra):
+        _local.render_start = time.perf_counter()
+
+    def on_rendered(sender, template, context, **extra):
+        start = getattr(_local, 'render_start', None)
+        stages = getattr(_local, 'stages', None)
+        if start is not None and stages is not None:
+            stages['render'] = stages.get('render', 0.0) + (time.perf_counter() - start) * 1000
+        _local.render_start = None
+
+    # weak=False: hai hàm trên là closure, không có tham chiếu nào khác giữ lại
+    before_render_template.connect(on_before_render, app, weak=False)
+    template_rendered.connect(on_rendered, app, weak=False)
@@ -0,0 +1,42 @@
+import base64
+import bisect
+import json
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key), ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))))
+    except (ValueError, TypeError):
+        return None
+
+
+def page_size(limit, default=PAGE_SIZE):
+    if not limit or limit < 1:
+        return default
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def paginate(items, keys, cursor, limit=PAGE_SIZE):
+    """Trang kế tiếp theo keyset: `keys` là khoá sắp xếp (tăng dần, không trùng) của `items`,
+    cursor là khoá của phần tử cuối trang trước. Trả về (trang, cursor trang sau hoặc None)"""
+    start = 0
+    after = decode_cursor(cursor)
+    if after is not None:
+        try:
+            start = bisect.bisect_right(keys, after)
+        except TypeError:
+            # Cursor của kiểu sắp xếp khác: bắt đầu lại từ đầu
+            start = 0
+
+    stop = start + limit
+    next_cursor = encode_cursor(keys[stop - 1]) if stop < len(items) else None
+    return items[start:stop], next_cursor
@@ -0,0 +1,69 @@
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import stage
+
+# Số thread hash song song và số yêu cầu được xếp hàng thêm; vượt quá thì báo bận ngay
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', 2))
+PASSWORD_QUEUE_SIZE = int(os.environ.get('PASSWORD_QUEUE_SIZE', 16))
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+class PasswordHasherBusy(Exception):
+    """Hàng đợi hash mật khẩu đã đầy"""
+
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIXES) and stored.count('$') == 2
+
+
+class PasswordHasher:
+    """Hash mật khẩu (có salt) trong một pool thread giới hạn, tách khỏi thread xử lý request.
+
+    scrypt / pbkdf2 nhả GIL khi tính nên các request khác vẫn chạy. Tối đa workers + queue_size
+    thread request chờ hash cùng lúc; yêu cầu vượt quá bị từ chối ngay (PasswordHasherBusy, trả 503)
+    nên một đợt đăng nhập dồn dập không chiếm hết thread của server.
+    Mật khẩu lưu dạng text thuần (dữ liệu cũ) vẫn đăng nhập được, cần hash lại sau đó.
+    """
+
+    def __init__(self, workers=PASSWORD_WORKERS, queue_size=PASSWORD_QUEUE_SIZE, method=PASSWORD_HASH_METHOD):
+        self.method = method
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._dummy_hash = None
+
+    def _run(self, fn, *args):
+        # Không chờ chỗ trống: quá tải thì báo bận ngay
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            with stage('password_hash'):
+                return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        """True nếu đúng mật khẩu. `stored` là None khi không có user: vẫn hash một lần
+        để thời gian trả lời không lộ username nào tồn tại"""
+        if stored is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = self.hash('')
+            self._run(check_password_hash, self._dummy_hash, password)
+            return False
+        if not is_hashed(stored):
+            return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+        return self._run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        return not is_hashed(stored) or not stored.startswith(self.method)
+
+
+password_hasher = PasswordHasher()
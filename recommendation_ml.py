@@ -1,12 +1,58 @@
-import json
-
 import numpy as np
-from datetime import datetime, timedelta
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from scipy.sparse import csr_matrix, vstack
 from collections import Counter, defaultdict
+from datetime import datetime
+import bisect
+import copy
+import hashlib
+import json
 import pickle
 import os
+import shutil
+import threading
+import time
+
+import storage
+from ann_index import IVFIndex, normalize_rows, select_top_k
+from catalog import catalog
+from cold_start import cold_start
+from cooccurrence import COOCCURRENCE_FILE, load_cooccurrence
+from event_log import SEARCH_CLICK_WINDOW, event_log
+from feature_pipeline import PARALLEL_MIN_PRODUCTS, TRAIN_WORKERS, fit_transform_sharded
+from metrics import stage
+from response_cache import recommendation_cache
+from trending import trending
+
+MODEL_DIR = 'recommendation_model'
+MODEL_FORMAT_VERSION = 2
+# File pickle của phiên bản trước, chỉ đọc một lần để chuyển sang định dạng mới
+LEGACY_MODEL_FILE = 'recommendation_model.pkl'
+
+# Chế độ embedding (LSA) + chỉ mục ANN, bật bằng số chiều > 0; nprobe là nút chỉnh recall / độ trễ
+EMBEDDING_DIM = int(os.environ.get('RECOMMENDER_EMBEDDING_DIM', 0))
+ANN_NPROBE = int(os.environ.get('RECOMMENDER_ANN_NPROBE', 8))
+
+# Trọng số điểm đồng xuất hiện (xem/mua cùng nhau) so với điểm nội dung; file do `python cooccurrence.py` tạo
+CF_WEIGHT = float(os.environ.get('RECOMMENDER_CF_WEIGHT', 0.5))
+
+# Chỉ một worker process cập nhật model cho mỗi catalog version: giữ quyền tối đa MODEL_REFRESH_LEASE giây,
+# các worker khác kiểm tra lại mỗi MODEL_REFRESH_RETRY giây trong lúc chờ
+MODEL_REFRESH_LEASE = float(os.environ.get('RECOMMENDER_REFRESH_LEASE', 600))
+MODEL_REFRESH_RETRY = float(os.environ.get('RECOMMENDER_REFRESH_RETRY', 30))
+
+
+def product_text(product):
+    return f"{product['name']} {product['brand']} {product['category']} {product['description']}"
+
+
+def text_hashes(texts):
+    """Hash 64 bit (int64) của từng text, dùng để phát hiện sản phẩm đổi nội dung mà không giữ text"""
+    return np.array([int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+                     for text in texts], dtype=np.int64)
 
 
 class ProductRecommendationML:
@@ -14,135 +60,392 @@ class ProductRecommendationML:
         self.vectorizer = TfidfVectorizer(max_features=100)
         self.product_vectors = None
         self.products = []
-        self.model_file = 'recommendation_model.pkl'
+        self.products_by_id = {}
+        self.user_activity = {}
+        self.model_dir = MODEL_DIR
+        self.neighbor_k = 20
+        self.neighbor_ids = None
+        self.neighbor_scores = None
+        # Id sản phẩm theo thứ tự hàng của product_vectors và chiều ngược lại
+        self.product_ids = None
+        self.product_rows = {}
+        # Hash text đã vectorize, cùng thứ tự product_ids (phát hiện thay đổi khi cập nhật model)
+        self.product_hashes = None
+        self.baseline_oov_rate = 0.0
+        self.new_tokens = 0
+        self.oov_tokens = 0
+        # Embedding float32 (LSA) theo thứ tự hàng và chỉ mục ANN trên đó, chỉ có khi embedding_dim > 0
+        self.embedding_dim = EMBEDDING_DIM
+        self.ann_nprobe = ANN_NPROBE
+        self.svd_components = None
+        self.embeddings = None
+        self.ann_index = None
+        # Láng giềng đồng xuất hiện từ lượt xem và đơn hàng, cùng định dạng với chỉ mục láng giềng nội dung
+        self.cf_weight = CF_WEIGHT
+        self.cf_product_ids = None
+        self.cf_rows = {}
+        self.cf_neighbor_ids = None
+        self.cf_neighbor_scores = None
+        self.cf_built_at = None
+        # Số process khi vectorize catalog lớn (>= parallel_min_products sản phẩm)
+        self.train_workers = TRAIN_WORKERS
+        self.parallel_min_products = PARALLEL_MIN_PRODUCTS
 
     def load_data(self):
-        with open('products.json', 'r', encoding='utf-8') as f:
-            self.products = json.load(f)
-
-        # Load recent views
-        try:
-            with open('recent_views.json', 'r', encoding='utf-8') as f:
-                self.recent_views = json.load(f)
-        except:
-            self.recent_views = {}
-
-        # Load search history
-        try:
-            with open('search_history.json', 'r', encoding='utf-8') as f:
-                self.search_history = json.load(f)
-        except:
-            self.search_history = {}
-
-        # Load orders
-        try:
-            with open('orders.json', 'r', encoding='utf-8') as f:
-                self.orders = json.load(f)
-        except:
-            self.orders = []
+        catalog.refresh()
+        self.products = catalog.products
+        self.products_by_id = catalog.by_id
+        # Dữ liệu hành vi được load theo từng user khi cần (truy vấn có index)
+        self.user_activity = {}
+
+    def get_user_activity(self, user_id):
+        """Lượt xem [(product_id, epoch)] mới nhất trước, thời điểm search, sản phẩm đã mua"""
+        if user_id not in self.user_activity:
+            self.user_activity[user_id] = {
+                'views': [(v['product_id'], v['viewed_ts']) for v in event_log.get_recent_views(user_id)],
+                'search_times': event_log.get_search_times(user_id, limit=20),
+                'purchases': storage.get_purchased_product_ids(user_id)
+            }
+        return self.user_activity[user_id]
 
     def build_product_features(self):
-        product_texts = []
-        for product in self.products:
-            text = f"{product['name']} {product['brand']} {product['category']} {product['description']}"
-            product_texts.append(text)
-
-        self.product_vectors = self.vectorizer.fit_transform(product_texts)
-        print(f"Đã vectorize {len(self.products)} sản phẩm")
+        product_texts = [product_text(product) for product in self.products]
+
+        if self.train_workers > 1 and len(product_texts) >= self.parallel_min_products:
+            # Catalog lớn: đếm token song song theo shard, gộp vocabulary / IDF một lần
+            self.product_vectors, self.baseline_oov_rate, timings = fit_transform_sharded(
+                self.vectorizer, product_texts, n_workers=self.train_workers
+            )
+            print(f"Đã vectorize {len(self.products)} sản phẩm bằng {self.train_workers} process ("
+                  + ', '.join(f'{name} {seconds:.2f}s' for name, seconds in timings.items()) + ")")
+        else:
+            self.product_vectors = self.vectorizer.fit_transform(product_texts)
+            self.baseline_oov_rate = self.oov_rate(product_texts)
+            print(f"Đã vectorize {len(self.products)} sản phẩm")
+
+        self.index_product_rows([p['id'] for p in self.products])
+        self.product_hashes = text_hashes(product_texts)
+        self.new_tokens = self.oov_tokens = 0
+
+        if self.embedding_dim:
+            self.build_embeddings()
+
+    def build_embeddings(self):
+        """Giảm ma trận TF-IDF xuống `embedding_dim` chiều (LSA) và tạo chỉ mục IVF trên đó"""
+        n_rows, n_features = self.product_vectors.shape
+        n_components = min(self.embedding_dim, n_features - 1, n_rows - 1)
+        if n_components < 1:
+            self.svd_components = self.embeddings = self.ann_index = None
+            return
+
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        svd.fit(self.product_vectors)
+        self.svd_components = svd.components_.astype(np.float32)
+        self.embeddings = self.embed(self.product_vectors)
+        self.ann_index = IVFIndex(nprobe=self.ann_nprobe).fit(self.embeddings)
+        print(f"Đã tạo embedding {n_components} chiều, chỉ mục IVF {self.ann_index.n_lists} cụm")
+
+    def embed(self, vectors):
+        return normalize_rows(np.asarray(vectors @ self.svd_components.T))
+
+    def count_oov(self, texts):
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        total = oov = 0
+        for text in texts:
+            tokens = analyzer(text)
+            total += len(tokens)
+            oov += sum(token not in vocabulary for token in tokens)
+        return total, oov
+
+    def oov_rate(self, texts):
+        total, oov = self.count_oov(texts)
+        return oov / total if total else 0.0
+
+    def index_product_rows(self, product_ids):
+        self.product_ids = np.array(product_ids, dtype=np.int64)
+        self.product_rows = {pid: i for i, pid in enumerate(product_ids)}
+
+    def build_neighbor_index(self, chunk_size=1024):
+        """Top-K sản phẩm tương đồng nhất cho mỗi sản phẩm (id int32, điểm float32)"""
+        n_rows = self.product_vectors.shape[0]
+        k = min(self.neighbor_k, n_rows - 1)
+
+        self.neighbor_ids = np.empty((n_rows, max(k, 0)), dtype=np.int32)
+        self.neighbor_scores = np.empty((n_rows, max(k, 0)), dtype=np.float32)
+
+        if k <= 0:
+            return
+
+        if self.ann_index is not None:
+            # Láng giềng xấp xỉ qua IVF: không phải so mọi cặp sản phẩm
+            rows, scores = self.ann_index.search(self.embeddings, k, exclude_rows=np.arange(n_rows))
+            self.neighbor_ids[:] = np.where(rows >= 0, self.product_ids[rows], -1)
+            self.neighbor_scores[:] = np.where(np.isfinite(scores), scores, 0)
+            print(f"Đã tạo chỉ mục {k} láng giềng (ANN) cho {n_rows} sản phẩm")
+            return
+
+        vectors = normalize(self.product_vectors)
+        self.compute_neighbor_rows(vectors, np.arange(n_rows), k, chunk_size)
+
+        print(f"Đã tạo chỉ mục {k} láng giềng cho {n_rows} sản phẩm")
+
+    def compute_neighbor_rows(self, vectors, rows, k, chunk_size=1024):
+        """Tính top-K láng giềng cho các hàng `rows` so với toàn bộ catalog"""
+        product_ids = self.product_ids.astype(np.int32)
+
+        # Tính theo từng khối hàng để không tạo ma trận N × N đầy đủ
+        for chunk_start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[chunk_start:chunk_start + chunk_size]
+            sims = (vectors[chunk_rows] @ vectors.T).toarray()
+            sims[np.arange(len(chunk_rows)), chunk_rows] = -np.inf
+
+            ids = np.broadcast_to(product_ids, sims.shape)
+            self.neighbor_ids[chunk_rows], self.neighbor_scores[chunk_rows] = select_top_k(ids, sims, k)
+
+    def load_cooccurrence(self):
+        """Nạp láng giềng đồng xuất hiện tính offline (không có file thì chỉ dùng điểm nội dung)"""
+        loaded = load_cooccurrence(os.path.join(self.model_dir, COOCCURRENCE_FILE))
+        if loaded is None:
+            self.cf_product_ids = self.cf_neighbor_ids = self.cf_neighbor_scores = self.cf_built_at = None
+            self.cf_rows = {}
+            return False
+        self.cf_product_ids, self.cf_neighbor_ids, self.cf_neighbor_scores, self.cf_built_at = loaded
+        self.cf_rows = {pid: row for row, pid in enumerate(self.cf_product_ids.tolist())}
+        return True
+
+    def diff_catalog(self, products):
+        """So hash text của catalog hiện tại với hash lúc vectorize: ({id mới/đổi: text}, id mới/đổi, id đã xoá)"""
+        texts = {p['id']: product_text(p) for p in products}
+        rows = np.array([self.product_rows.get(pid, -1) for pid in texts], dtype=np.int64)
+        unchanged = np.zeros(len(rows), dtype=bool)
+        known = rows >= 0
+        unchanged[known] = self.product_hashes[rows[known]] == text_hashes(texts.values())[known]
+
+        changed = [pid for pid, same in zip(texts, unchanged.tolist()) if not same]
+        removed = [pid for pid in self.product_rows if pid not in texts]
+        return {pid: texts[pid] for pid in changed}, changed, removed
+
+    def update_model(self, products, drift_threshold=0.15):
+        """Đưa sản phẩm mới/đổi vào model với vocabulary cố định.
+
+        Chỉ fit lại toàn bộ khi tỉ lệ token ngoài vocabulary của phần text mới vượt
+        tỉ lệ lúc fit quá `drift_threshold`. Trả về 'unchanged', 'incremental' hoặc 'full'.
+        """
+        changed_texts, changed, removed = self.diff_catalog(products)
+        if not changed and not removed:
+            return 'unchanged'
+
+        self.products = list(products)
+
+        total, oov = self.count_oov(changed_texts.values())
+        self.new_tokens += total
+        self.oov_tokens += oov
+        drift = self.oov_tokens / self.new_tokens - self.baseline_oov_rate if self.new_tokens else 0.0
+
+        if drift > drift_threshold:
+            print(f"Vocabulary trôi {drift:.2f} > {drift_threshold}, train lại toàn bộ")
+            self.vectorizer = TfidfVectorizer(max_features=self.vectorizer.max_features)
+            self.build_product_features()
+            self.build_neighbor_index()
+            return 'full'
+
+        # Giữ nguyên các hàng không đổi, thêm hàng mới ở cuối (transform với vocabulary cũ)
+        changed_set = set(changed)
+        stale = changed_set | set(removed)
+        keep_rows = [row for row, pid in enumerate(self.product_ids.tolist()) if pid not in stale]
+        kept_ids = self.product_ids[keep_rows].tolist()
+
+        if changed:
+            new_vectors = self.vectorizer.transform([changed_texts[pid] for pid in changed])
+        else:
+            # Chỉ xoá sản phẩm: không có hàng mới
+            new_vectors = csr_matrix((0, self.product_vectors.shape[1]), dtype=self.product_vectors.dtype)
+        self.product_vectors = vstack([self.product_vectors[keep_rows], new_vectors]).tocsr()
+        self.product_hashes = np.concatenate([self.product_hashes[keep_rows], text_hashes(changed_texts.values())])
+        self.index_product_rows(kept_ids + changed)
+
+        if self.ann_index is not None:
+            # Chiếu hàng mới bằng các thành phần SVD cũ, gán lại cụm với centroid cũ
+            self.embeddings = np.vstack([self.embeddings[keep_rows], self.embed(new_vectors)])
+            self.ann_index = IVFIndex(nprobe=self.ann_nprobe).assign(self.embeddings, self.ann_index.centroids)
+
+        self.update_neighbor_index(keep_rows, stale)
+        print(f"Đã cập nhật {len(changed)} sản phẩm, xoá {len(removed)} sản phẩm khỏi model")
+        return 'incremental'
+
+    def update_neighbor_index(self, keep_rows, stale_ids):
+        """Gộp các sản phẩm vừa thêm/đổi vào danh sách láng giềng của các hàng giữ nguyên.
+
+        Hàng giữ nguyên có láng giềng vừa bị xoá/đổi thì danh sách cũ thiếu chỗ: tính lại
+        đầy đủ cùng với các hàng mới, nên kết quả giống khi tính lại toàn bộ.
+        """
+        n_rows = self.product_vectors.shape[0]
+        n_kept = len(keep_rows)
+        k = min(self.neighbor_k, n_rows - 1)
+
+        if self.neighbor_ids is None or k <= 0 or self.neighbor_ids.shape[1] != k:
+            self.build_neighbor_index()
+            return
+
+        old_ids = self.neighbor_ids[keep_rows]
+        old_scores = self.neighbor_scores[keep_rows]
+        refill = np.isin(old_ids, list(stale_ids)).any(axis=1)
+
+        # Thay đổi quá nhiều: tính lại toàn bộ rẻ hơn
+        if n_rows - n_kept + refill.sum() > n_kept // 4:
+            self.build_neighbor_index()
+            return
+
+        vectors = normalize(self.product_vectors)
+        self.neighbor_ids = np.empty((n_rows, k), dtype=np.int32)
+        self.neighbor_scores = np.empty((n_rows, k), dtype=np.float32)
+
+        # Hàng còn đủ láng giềng cũ: chỉ cần so thêm với các hàng mới
+        merge = np.flatnonzero(~refill)
+        if len(merge):
+            new_ids = self.product_ids[n_kept:].astype(np.int32)
+            cross = (vectors[merge] @ vectors[n_kept:].T).toarray().astype(np.float32)
+            candidate_ids = np.hstack([old_ids[merge], np.broadcast_to(new_ids, cross.shape)])
+            candidate_scores = np.hstack([old_scores[merge], cross])
+            self.neighbor_ids[merge], self.neighbor_scores[merge] = select_top_k(candidate_ids, candidate_scores, k)
+
+        self.compute_neighbor_rows(vectors, np.concatenate([np.flatnonzero(refill), np.arange(n_kept, n_rows)]), k)
 
     def get_excluded_products(self, user_id):
-        user_id_str = str(user_id)
-        excluded = set()
+        activity = self.get_user_activity(user_id)
 
         # 1. Loại trừ sản phẩm đã click
-        if user_id_str in self.recent_views:
-            for view in self.recent_views[user_id_str]:
-                excluded.add(view['product_id'])
+        excluded = {pid for pid, _ in activity['views']}
 
-        # 2. Loại trừ sản phẩm đã mua
-        for order in self.orders:
-            if order['user_id'] == user_id:
-                excluded.add(order['product_id'])
+        # 2. Loại trừ sản phẩm đã mua (truy vấn theo index orders(user_id, product_id))
+        excluded |= activity['purchases']
 
         # 3. Loại trừ sản phẩm từ search (clicked sau khi search)
-        # Lấy product_id của các sản phẩm được xem trong 10 phút sau search
-        if user_id_str in self.search_history:
-            for search in self.search_history[user_id_str][:20]:  # 20 search gần nhất
-                try:
-                    search_time = datetime.fromisoformat(search['timestamp'])
-
-                    # Kiểm tra xem có sản phẩm nào được click trong 10 phút sau search
-                    if user_id_str in self.recent_views:
-                        for view in self.recent_views[user_id_str]:
-                            try:
-                                view_time = datetime.fromisoformat(view['viewed_at'])
-                                time_diff = (view_time - search_time).total_seconds()
-
-                                # Nếu view trong 10 phút sau search → loại trừ
-                                if 0 <= time_diff <= 600:
-                                    excluded.add(view['product_id'])
-                            except:
-                                continue
-                except:
+        # Lấy product_id của các sản phẩm được xem trong SEARCH_CLICK_WINDOW giây sau search (20 search gần nhất)
+        search_times = sorted(activity['search_times'])
+        if search_times:
+            for pid, view_time in activity['views']:
+                if view_time is None:
                     continue
+                # Lần search gần nhất không muộn hơn lượt xem
+                i = bisect.bisect_right(search_times, view_time) - 1
+                if i >= 0 and view_time - search_times[i] <= SEARCH_CLICK_WINDOW:
+                    excluded.add(pid)
 
         return excluded
 
     def get_clicked_products_profile(self, user_id):
-        user_id_str = str(user_id)
-
-        if user_id_str not in self.recent_views:
-            return []
-
         # Lấy tối đa 10 sản phẩm click gần nhất
-        clicked_products = []
-        for view in self.recent_views[user_id_str][:10]:
-            clicked_products.append(view['product_id'])
-
-        return clicked_products
+        return [pid for pid, _ in self.get_user_activity(user_id)['views'][:10]]
 
     def calculate_similarity_based_on_clicks(self, clicked_product_ids, exclude_ids):
         if not clicked_product_ids:
             return {}
 
         # Lấy indices của sản phẩm đã click
-        clicked_indices = []
-        for pid in clicked_product_ids:
-            idx = next((i for i, p in enumerate(self.products) if p['id'] == pid), None)
-            if idx is not None:
-                clicked_indices.append(idx)
+        clicked_indices = [self.product_rows[pid] for pid in clicked_product_ids
+                           if pid in self.product_rows]
 
         if not clicked_indices:
             return {}
 
-        # Tính similarity cho từng sản phẩm
-        product_scores = {}
+        # Similarity của toàn bộ catalog với các sản phẩm đã click: một phép nhân ma trận
+        similarities = cosine_similarity(
+            self.product_vectors,
+            self.product_vectors[clicked_indices]
+        )
 
-        for i, product in enumerate(self.products):
-            # Skip nếu trong danh sách loại trừ
-            if product['id'] in exclude_ids:
-                continue
+        # Tính trọng số: sản phẩm click gần đây có trọng số cao hơn
+        weights = 1.0 / np.arange(1, len(clicked_indices) + 1)
+        weights /= weights.sum()
 
-            # Skip nếu hết hàng
-            if product['stock'] <= 0:
-                continue
+        # Điểm = tổng có trọng số của similarity
+        scores = similarities @ weights
+
+        # Mask loại trừ và hết hàng (sản phẩm đã bị xoá khỏi catalog coi như hết hàng)
+        product_ids = self.product_ids
+        in_stock = self.in_stock_mask()
+        keep = in_stock & ~np.isin(product_ids, list(exclude_ids))
+
+        return dict(zip(product_ids[keep].tolist(), scores[keep].tolist()))
+
+    def in_stock_mask(self):
+        """Mask còn hàng theo thứ tự hàng của product_vectors, lấy stock từ catalog hiện tại"""
+        by_id = self.products_by_id
+        return np.fromiter(
+            (pid in by_id and by_id[pid]['stock'] > 0 for pid in self.product_ids.tolist()),
+            dtype=bool, count=len(self.product_ids)
+        )
+
+    def calculate_similarity_from_neighbors(self, clicked_product_ids, exclude_ids):
+        """Gộp danh sách láng giềng của các sản phẩm đã click, chi phí clicks × K"""
+        clicked_rows = [self.product_rows[pid] for pid in clicked_product_ids
+                        if pid in self.product_rows]
+
+        if not clicked_rows:
+            return {}
 
-            # Tính cosine similarity với tất cả sản phẩm đã click
-            similarities = cosine_similarity(
-                self.product_vectors[i:i + 1],
-                self.product_vectors[clicked_indices]
-            )[0]
+        weights = 1.0 / np.arange(1, len(clicked_rows) + 1)
+        weights /= weights.sum()
 
-            # Tính trọng số: sản phẩm click gần đây có trọng số cao hơn
-            weights = [1.0 / (pos + 1) for pos in range(len(clicked_indices))]
-            total_weight = sum(weights)
-            weights = [w / total_weight for w in weights]
+        product_scores = defaultdict(float)
+        for weight, row in zip(weights.tolist(), clicked_rows):
+            for pid, sim in zip(self.neighbor_ids[row].tolist(), self.neighbor_scores[row].tolist()):
+                product_scores[pid] += weight * sim
 
-            # Điểm = tổng có trọng số của similarity
-            weighted_score = sum(sim * weight for sim, weight in zip(similarities, weights))
+        return {
+            pid: score for pid, score in product_scores.items()
+            if pid not in exclude_ids
+            and pid in self.products_by_id
+            and self.products_by_id[pid]['stock'] > 0
+        }
+
+    def calculate_similarity_from_embeddings(self, clicked_product_ids, exclude_ids, n):
+        """Truy vấn chỉ mục ANN bằng vector hồ sơ (trung bình có trọng số các embedding đã click)"""
+        clicked_rows = [self.product_rows[pid] for pid in clicked_product_ids
+                        if pid in self.product_rows]
+
+        if not clicked_rows:
+            return {}
 
-            product_scores[product['id']] = weighted_score
+        weights = 1.0 / np.arange(1, len(clicked_rows) + 1)
+        weights /= weights.sum()
+        profile = normalize_rows((weights @ self.embeddings[clicked_rows])[None, :])
+
+        # Lấy dư để bù cho sản phẩm bị loại trừ / hết hàng
+        k = min(len(self.product_ids), n + len(exclude_ids) + self.neighbor_k)
+        rows, scores = self.ann_index.search(profile, k)
+        found = rows[0] >= 0
+        return {
+            pid: score for pid, score in zip(self.product_ids[rows[0][found]].tolist(), scores[0][found].tolist())
+            if pid not in exclude_ids
+            and pid in self.products_by_id
+            and self.products_by_id[pid]['stock'] > 0
+        }
 
+    def cooccurrence_scores(self, clicked_product_ids):
+        """Điểm đồng xuất hiện với các sản phẩm đã click (chưa lọc), chi phí clicks × K"""
+        clicked_rows = [self.cf_rows[pid] for pid in clicked_product_ids if pid in self.cf_rows]
+        if not clicked_rows or self.cf_weight <= 0:
+            return {}
+
+        weights = 1.0 / np.arange(1, len(clicked_rows) + 1)
+        weights *= self.cf_weight / weights.sum()
+
+        scores = defaultdict(float)
+        for weight, row in zip(weights.tolist(), clicked_rows):
+            for pid, score in zip(self.cf_neighbor_ids[row].tolist(), self.cf_neighbor_scores[row].tolist()):
+                if pid >= 0:
+                    scores[pid] += weight * score
+        return scores
+
+    def add_cooccurrence_scores(self, product_scores, clicked_product_ids, exclude_ids):
+        for pid, score in self.cooccurrence_scores(clicked_product_ids).items():
+            if (pid not in exclude_ids
+                    and pid in self.products_by_id
+                    and self.products_by_id[pid]['stock'] > 0):
+                product_scores[pid] = product_scores.get(pid, 0.0) + score
         return product_scores
 
     def add_diversity_bonus(self, product_scores, clicked_product_ids):
@@ -151,7 +454,7 @@ class ProductRecommendationML:
         clicked_categories = set()
 
         for pid in clicked_product_ids:
-            product = next((p for p in self.products if p['id'] == pid), None)
+            product = self.products_by_id.get(pid)
             if product:
                 clicked_brands.add(product['brand'])
                 clicked_categories.add(product['category'])
@@ -159,7 +462,7 @@ class ProductRecommendationML:
         # Thêm bonus cho sản phẩm
         adjusted_scores = {}
         for product_id, score in product_scores.items():
-            product = next((p for p in self.products if p['id'] == product_id), None)
+            product = self.products_by_id.get(product_id)
             if not product:
                 continue
 
@@ -188,25 +491,30 @@ class ProductRecommendationML:
         if not clicked_product_ids:
             print(f"User {user_id} chưa có lượt click, trả về sản phẩm phổ biến")
 
-            # Lấy sản phẩm có giá trung bình, còn hàng, không trong excluded
-            available_products = [
-                p for p in self.products
-                if p['id'] not in excluded_ids and p['stock'] > 0
-            ]
-
-            # Sort theo giá gần với giá trung bình
-            if available_products:
-                avg_price = sum(p['price'] for p in available_products) / len(available_products)
-                available_products.sort(key=lambda x: abs(x['price'] - avg_price))
-                return available_products[:n]
-            else:
-                return []
-
-        # Tính điểm similarity dựa trên clicks
-        product_scores = self.calculate_similarity_based_on_clicks(
-            clicked_product_ids,
-            excluded_ids
-        )
+            # Danh sách tính sẵn (bán chạy, còn hàng), chỉ bỏ qua các sản phẩm bị loại trừ
+            return cold_start.top(n, strategy='popular', exclude=excluded_ids)
+
+        # Tính điểm similarity dựa trên clicks: chỉ mục ANN (chế độ embedding), chỉ mục láng giềng,
+        # hoặc tính chính xác trên toàn catalog
+        if self.ann_index is not None:
+            product_scores = self.calculate_similarity_from_embeddings(
+                clicked_product_ids,
+                excluded_ids,
+                n
+            )
+        elif self.neighbor_ids is not None:
+            product_scores = self.calculate_similarity_from_neighbors(
+                clicked_product_ids,
+                excluded_ids
+            )
+        else:
+            product_scores = self.calculate_similarity_based_on_clicks(
+                clicked_product_ids,
+                excluded_ids
+            )
+
+        # Cộng điểm hành vi: sản phẩm hay được xem/mua cùng các sản phẩm đã click
+        product_scores = self.add_cooccurrence_scores(product_scores, clicked_product_ids, excluded_ids)
 
         if not product_scores:
             return []
@@ -227,100 +535,475 @@ class ProductRecommendationML:
         # Lấy thông tin đầy đủ của sản phẩm
         recommendations = []
         for pid in recommended_ids:
-            product = next((p for p in self.products if p['id'] == pid), None)
+            product = self.products_by_id.get(pid)
             if product:
                 recommendations.append(product)
 
         return recommendations
 
+    def get_recommendations_batch(self, user_ids, n=6, chunk_size=256):
+        """Gợi ý cho nhiều user cùng lúc: ma trận users × sản phẩm đã click nhân với ma trận TF-IDF.
+
+        Tính theo từng nhóm `chunk_size` user, nên bộ nhớ tối đa là chunk_size × số sản phẩm
+        (không phải số user × số sản phẩm) kể cả khi chạy cho toàn bộ tài khoản.
+        """
+        user_ids = list(user_ids)
+        products = [self.products_by_id.get(pid) for pid in self.product_ids.tolist()]
+        context = {
+            'products': products,
+            'in_stock': self.in_stock_mask(),
+            'brands': np.array([p['brand'] if p else None for p in products], dtype=object),
+            'categories': np.array([p['category'] if p else None for p in products], dtype=object),
+            # Vector đã chuẩn hoá L2 nên tích vô hướng chính là cosine similarity
+            'vectors': normalize(self.product_vectors)
+        }
+
+        results = {}
+        for start in range(0, len(user_ids), chunk_size):
+            results.update(self.recommend_chunk(user_ids[start:start + chunk_size], n, context))
+            # Dữ liệu hành vi chỉ cần cho nhóm đang tính
+            self.user_activity = {}
+        return results
+
+    def recommend_chunk(self, user_ids, n, context):
+        n_rows = self.product_vectors.shape[0]
+        positions = self.product_rows
+        products, in_stock = context['products'], context['in_stock']
+        brands, categories, vectors = context['brands'], context['categories'], context['vectors']
+
+        results = {}
+        batch_users = []
+        rows, cols, vals = [], [], []
+        excluded_rows = []
+
+        for user_id in user_ids:
+            clicked_indices = [positions[pid] for pid in self.get_clicked_products_profile(user_id)
+                               if pid in positions]
+
+            # User chưa có click: dùng luồng gợi ý phổ biến
+            if not clicked_indices:
+                results[user_id] = self.get_recommendations(user_id, n=n)
+                continue
+
+            row = len(batch_users)
+            batch_users.append((user_id, clicked_indices))
+
+            weights = 1.0 / np.arange(1, len(clicked_indices) + 1)
+            weights /= weights.sum()
+            rows.extend([row] * len(clicked_indices))
+            cols.extend(clicked_indices)
+            vals.extend(weights.tolist())
+
+            excluded_rows.append([positions[pid] for pid in self.get_excluded_products(user_id)
+                                  if pid in positions])
+
+        if not batch_users:
+            return results
+
+        # Ma trận trọng số users × sản phẩm (khác 0 ở các sản phẩm đã click)
+        weight_matrix = csr_matrix((vals, (rows, cols)), shape=(len(batch_users), n_rows))
+        scores = ((weight_matrix @ vectors) @ vectors.T).toarray()
+
+        # Mask loại trừ theo từng user của nhóm
+        keep = np.tile(in_stock, (len(batch_users), 1))
+        for row, excluded in enumerate(excluded_rows):
+            keep[row, excluded] = False
+
+        for row, (user_id, clicked_indices) in enumerate(batch_users):
+            # Điểm thưởng đa dạng cho brand/category chưa click
+            scores[row] += 0.05 * ~np.isin(brands, brands[clicked_indices])
+            scores[row] += 0.05 * ~np.isin(categories, categories[clicked_indices])
+
+            cf_scores = self.cooccurrence_scores(self.product_ids[clicked_indices].tolist())
+            cf_ids = [pid for pid in cf_scores if pid in positions]
+            scores[row, [positions[pid] for pid in cf_ids]] += [cf_scores[pid] for pid in cf_ids]
+
+            candidates = np.flatnonzero(keep[row])
+            order = np.argsort(-scores[row, candidates], kind='stable')[:n]
+            results[user_id] = [products[i] for i in candidates[order]]
+
+        return results
+
     def get_trending_products(self, days=7, n=6):
-        cutoff_date = datetime.now() - timedelta(days=days)
-        product_views = Counter()
-
-        for user_views in self.recent_views.values():
-            for view in user_views:
-                try:
-                    view_date = datetime.fromisoformat(view['viewed_at'])
-                    if view_date >= cutoff_date:
-                        product_views[view['product_id']] += 1
-                except:
-                    continue
+        # Lấy dư để bù cho sản phẩm hết hàng
+        ranked = trending.top(trending.window_for_days(days), n=n * 2)
 
-        trending_ids = [pid for pid, _ in product_views.most_common(n)]
         trending_products = [
-            p for p in self.products
-            if p['id'] in trending_ids and p['stock'] > 0
+            self.products_by_id[pid] for pid, _ in ranked
+            if pid in self.products_by_id and self.products_by_id[pid]['stock'] > 0
         ]
 
-        return trending_products
+        return trending_products[:n]
 
     def train_and_save(self):
         print("Đang train model...")
-        self.load_data()
-        self.build_product_features()
-
-        model_data = {
-            'vectorizer': self.vectorizer,
-            'product_vectors': self.product_vectors,
-            'products': self.products
+        timings = {}
+        for name, step in [('load', self.load_data), ('features', self.build_product_features),
+                           ('neighbors', self.build_neighbor_index), ('cooccurrence', self.load_cooccurrence),
+                           ('save', self.save_model)]:
+            start = time.perf_counter()
+            with stage(f'train_{name}'):
+                step()
+            timings[name] = time.perf_counter() - start
+
+        print(f"Model đã được train và lưu vào '{self.model_dir}' ("
+              + ', '.join(f'{name} {seconds:.2f}s' for name, seconds in timings.items()) + ")")
+
+    def save_model(self):
+        """Ghi model thành một phiên bản mới trong thư mục model rồi chuyển con trỏ CURRENT sang.
+
+        Ma trận CSR, id sản phẩm và chỉ mục láng giềng lưu thành file .npy riêng để các worker
+        np.load(mmap_mode='r') dùng chung một bản trong page cache thay vì unpickle từng bản.
+        """
+        version = f"v{datetime.now():%Y%m%d%H%M%S%f}"
+        tmp_dir = os.path.join(self.model_dir, f'{version}.{os.getpid()}.tmp')
+        os.makedirs(tmp_dir)
+
+        vectors = self.product_vectors.tocsr()
+        arrays = {
+            'vectors_data': vectors.data,
+            'vectors_indices': vectors.indices,
+            'vectors_indptr': vectors.indptr,
+            'idf': self.vectorizer.idf_,
+            'product_ids': self.product_ids,
+            'product_hashes': self.product_hashes,
         }
-
-        with open(self.model_file, 'wb') as f:
-            pickle.dump(model_data, f)
-
-        print(f"Model đã được train và lưu vào '{self.model_file}'")
+        if self.neighbor_ids is not None:
+            arrays['neighbor_ids'] = self.neighbor_ids
+            arrays['neighbor_scores'] = self.neighbor_scores
+        if self.ann_index is not None:
+            arrays['embeddings'] = self.embeddings
+            arrays['svd_components'] = self.svd_components
+            arrays.update(self.ann_index.arrays())
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.asarray(array))
+
+        vocabulary = sorted(self.vectorizer.vocabulary_, key=self.vectorizer.vocabulary_.get)
+        with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+
+        manifest = {
+            'format_version': MODEL_FORMAT_VERSION,
+            'created_at': datetime.now().isoformat(),
+            'shape': list(vectors.shape),
+            'max_features': self.vectorizer.max_features,
+            'neighbor_k': self.neighbor_k,
+            'baseline_oov_rate': self.baseline_oov_rate,
+            'new_tokens': self.new_tokens,
+            'oov_tokens': self.oov_tokens,
+            'embedding_dim': self.embedding_dim
+        }
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        # Đổi tên thư mục rồi mới đổi con trỏ: process khác không bao giờ đọc phải bản ghi dở
+        os.rename(tmp_dir, os.path.join(self.model_dir, version))
+        tmp_pointer = os.path.join(self.model_dir, f'CURRENT.{os.getpid()}.tmp')
+        with open(tmp_pointer, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_pointer, os.path.join(self.model_dir, 'CURRENT'))
+
+        self.remove_old_versions(keep=version)
+
+    def remove_old_versions(self, keep, retain=2):
+        """Xoá các phiên bản cũ, giữ `retain` bản mới nhất (worker đang mmap bản cũ vẫn đọc được)"""
+        versions = sorted(name for name in os.listdir(self.model_dir)
+                          if name.startswith('v') and not name.endswith('.tmp') and name != keep)
+        for name in versions[:max(len(versions) - retain + 1, 0)]:
+            shutil.rmtree(os.path.join(self.model_dir, name), ignore_errors=True)
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.model_dir, 'CURRENT'), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
 
     def load_model(self):
-        if os.path.exists(self.model_file):
-            try:
-                with open(self.model_file, 'rb') as f:
-                    model_data = pickle.load(f)
-                    self.vectorizer = model_data['vectorizer']
-                    self.product_vectors = model_data['product_vectors']
-                    self.products = model_data['products']
-                print(f" Đã load model từ '{self.model_file}'")
+        version = self.current_version()
+        if version is None:
+            # Chưa có bản theo định dạng mới: chuyển đổi từ file pickle cũ nếu có
+            if self.load_legacy_model():
+                self.save_model()
+                self.load_cooccurrence()
                 return True
-            except Exception as e:
-                print(f" Lỗi khi load model: {e}")
+            return False
+
+        path = os.path.join(self.model_dir, version)
+        try:
+            with open(os.path.join(path, 'manifest.json'), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest['format_version'] != MODEL_FORMAT_VERSION:
+                print(f" Model '{version}' có định dạng {manifest['format_version']}, cần train lại")
                 return False
-        return False
+            if manifest.get('embedding_dim', 0) != self.embedding_dim:
+                print(f" Model '{version}' có embedding_dim {manifest.get('embedding_dim', 0)}, "
+                      f"cấu hình hiện tại {self.embedding_dim}, cần train lại")
+                return False
+
+            def load_array(name):
+                array_file = os.path.join(path, f'{name}.npy')
+                return np.load(array_file, mmap_mode='r') if os.path.exists(array_file) else None
+
+            with open(os.path.join(path, 'vocabulary.json'), 'r', encoding='utf-8') as f:
+                vocabulary = json.load(f)
+            self.vectorizer = TfidfVectorizer(max_features=manifest['max_features'])
+            self.vectorizer.vocabulary_ = {term: i for i, term in enumerate(vocabulary)}
+            self.vectorizer.idf_ = np.asarray(load_array('idf'))
+
+            self.product_vectors = csr_matrix(
+                (load_array('vectors_data'), load_array('vectors_indices'), load_array('vectors_indptr')),
+                shape=tuple(manifest['shape'])
+            )
+            self.neighbor_k = manifest['neighbor_k']
+            self.neighbor_ids = load_array('neighbor_ids')
+            self.neighbor_scores = load_array('neighbor_scores')
+
+            self.embeddings = load_array('embeddings')
+            self.svd_components = load_array('svd_components')
+            self.ann_index = None
+            if self.embeddings is not None:
+                self.ann_index = IVFIndex.from_arrays(
+                    self.embeddings, load_array('ivf_centroids'), load_array('ivf_order'),
+                    load_array('ivf_offsets'), nprobe=self.ann_nprobe
+                )
+
+            self.load_cooccurrence()
+
+            self.index_product_rows(load_array('product_ids').tolist())
+            self.product_hashes = load_array('product_hashes')
+            if self.product_hashes is None:
+                # Bản lưu trước khi có product_hashes.npy: tính hash từ product_texts.json
+                with open(os.path.join(path, 'product_texts.json'), 'r', encoding='utf-8') as f:
+                    self.product_hashes = text_hashes(json.load(f))
+            self.baseline_oov_rate = manifest['baseline_oov_rate']
+            self.new_tokens = manifest['new_tokens']
+            self.oov_tokens = manifest['oov_tokens']
+
+            self.load_data()
+            print(f" Đã load model '{version}' từ '{self.model_dir}'")
+            return True
+        except Exception as e:
+            print(f" Lỗi khi load model: {e}")
+            return False
+
+    def load_legacy_model(self):
+        """Đọc model pickle của phiên bản trước"""
+        if not os.path.exists(LEGACY_MODEL_FILE):
+            return False
+        try:
+            with open(LEGACY_MODEL_FILE, 'rb') as f:
+                model_data = pickle.load(f)
+                self.vectorizer = model_data['vectorizer']
+                self.product_vectors = model_data['product_vectors']
+                self.products = model_data['products']
+                self.neighbor_ids = model_data.get('neighbor_ids')
+                self.neighbor_scores = model_data.get('neighbor_scores')
+                if 'product_ids' in model_data:
+                    self.index_product_rows(model_data['product_ids'].tolist())
+                    self.product_hashes = text_hashes(model_data['product_texts'][pid]
+                                                      for pid in self.product_ids.tolist())
+                    self.baseline_oov_rate = model_data['baseline_oov_rate']
+                    self.new_tokens = model_data['new_tokens']
+                    self.oov_tokens = model_data['oov_tokens']
+                else:
+                    texts = [product_text(p) for p in self.products]
+                    self.index_product_rows([p['id'] for p in self.products])
+                    self.product_hashes = text_hashes(texts)
+                    self.baseline_oov_rate = self.oov_rate(texts)
+            print(f" Đã load model cũ từ '{LEGACY_MODEL_FILE}', chuyển sang '{self.model_dir}'")
+            return True
+        except Exception as e:
+            print(f" Lỗi khi load model cũ: {e}")
+            return False
+
+    def new_session(self):
+        """Bản sao nông dùng chung vectorizer và ma trận sản phẩm, dữ liệu người dùng load riêng"""
+        session = copy.copy(self)
+        session.load_data()
+        return session
+
+
+class RecommenderService:
+    """Giữ model trong process, chỉ load lại khi con trỏ CURRENT của thư mục model đổi mtime.
+
+    Khi catalog thay đổi, chỉ worker process nhận được quyền (`storage.claim_model_refresh`) cập nhật
+    model tăng dần ở thread nền trên một bản sao, lưu ra file rồi mới thay thế model đang phục vụ;
+    các worker khác load lại bản đó khi con trỏ CURRENT đổi.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, refresh_lease=MODEL_REFRESH_LEASE, refresh_retry=MODEL_REFRESH_RETRY):
+        self.model_dir = model_dir
+        self.refresh_lease = refresh_lease
+        self.refresh_retry = refresh_retry
+        # Tăng mỗi khi model đang phục vụ được thay (load lại / cập nhật nền): cache gợi ý cũ hết hiệu lực
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._recommender = None
+        self._loaded_mtime = None
+        self._refresh_lock = threading.Lock()
+        # Catalog version đã xử lý (cập nhật xong, lỗi, hoặc process khác đã cập nhật)
+        self._catalog_version = None
+        self._refresh_retry_at = 0
+        self._loaded_cf_mtime = None
+
+    def _model_mtime(self):
+        try:
+            return os.path.getmtime(os.path.join(self.model_dir, 'CURRENT'))
+        except OSError:
+            return None
+
+    def _cf_mtime(self):
+        try:
+            return os.path.getmtime(os.path.join(self.model_dir, COOCCURRENCE_FILE))
+        except OSError:
+            return None
+
+    def _is_fresh(self):
+        return self._recommender is not None and self._loaded_mtime == self._model_mtime()
+
+    def get_recommender(self):
+        if (catalog.version != self._catalog_version and not self._refresh_lock.locked()
+                and time.monotonic() >= self._refresh_retry_at):
+            threading.Thread(target=self.refresh_model, daemon=True).start()
+
+        if self._is_fresh():
+            if self._loaded_cf_mtime != self._cf_mtime():
+                self.reload_cooccurrence()
+            return self._recommender
+
+        with self._lock:
+            # Thread khác có thể đã load xong trong lúc chờ lock
+            if self._is_fresh():
+                return self._recommender
+
+            with stage('model_load'):
+                recommender = ProductRecommendationML()
+                recommender.model_dir = self.model_dir
+                if not recommender.load_model():
+                    recommender.train_and_save()
+                # Tính sẵn danh sách cold-start cùng lúc load model
+                cold_start.refresh()
+
+            self._recommender = recommender
+            self._loaded_mtime = self._model_mtime()
+            self._loaded_cf_mtime = self._cf_mtime()
+            self.generation += 1
+            return recommender
+
+    def reload_cooccurrence(self):
+        """Job offline vừa ghi file đồng xuất hiện mới: chỉ nạp lại ba mảng đó trên một bản sao nông"""
+        with self._lock:
+            cf_mtime = self._cf_mtime()
+            if self._recommender is None or cf_mtime == self._loaded_cf_mtime:
+                return
+            updated = copy.copy(self._recommender)
+            updated.load_cooccurrence()
+            self._recommender = updated
+            self._loaded_cf_mtime = cf_mtime
+            self.generation += 1
+
+    def refresh_model(self):
+        """Cập nhật model theo catalog hiện tại, trả về chế độ cập nhật, 'skipped' nếu process khác
+        cập nhật, hoặc None nếu đang chạy / lỗi"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return None
+
+        version = claim = None
+        try:
+            version = catalog.version
+            claim = storage.claim_model_refresh(version, self.refresh_lease)
+            if claim != 'claimed':
+                return 'skipped'
+
+            try:
+                current = self.get_recommender()
+                products = catalog.all()
+
+                # Chỉ đổi stock thì text không đổi, không cần copy model
+                _, changed, removed = current.diff_catalog(products)
+                mode = 'unchanged'
+                if changed or removed:
+                    updated = copy.deepcopy(current)
+                    mode = updated.update_model(products)
+                    updated.save_model()
+
+                    with self._lock:
+                        self._recommender = updated
+                        self._loaded_mtime = self._model_mtime()
+                        self.generation += 1
+                return mode
+            finally:
+                # Đánh dấu xong cả khi lỗi: không process nào thử lại version này ở mỗi request
+                storage.finish_model_refresh(version)
+        except Exception as e:
+            print(f"Lỗi khi cập nhật model: {e}")
+            return None
+        finally:
+            if claim == 'busy':
+                # Process khác đang cập nhật: kiểm tra lại sau (nếu process đó chết, lease sẽ hết hạn)
+                self._refresh_retry_at = time.monotonic() + self.refresh_retry
+            else:
+                self._catalog_version = version
+            self._refresh_lock.release()
+
+
+recommender_service = RecommenderService()
+
+
+# Số lần gợi ý của từng user bị invalidate trong process này (sự kiện chưa kịp ghi xuống database)
+_user_epochs = Counter()
+_user_epochs_lock = threading.Lock()
+
+
+def user_cache_token(user_id):
+    """Token của dữ liệu hành vi hiện tại: (lần invalidate trong process, số thứ tự hoạt động trong database).
+    Số thứ tự database tăng khi worker process nào đó ghi lượt xem / tìm kiếm / đơn hàng của user"""
+    return _user_epochs[user_id], storage.get_activity_seq(user_id)
 
 
 def get_ml_recommendations(user_id, n=6):
-    recommender = ProductRecommendationML()
+    recommender = recommender_service.get_recommender()
 
-    if not recommender.load_model():
-        recommender.train_and_save()
-    else:
-        recommender.load_data()
+    # Model, nội dung catalog hoặc trạng thái còn/hết hàng đổi thì toàn bộ cache hết hiệu lực;
+    # số lượng tồn kho hiển thị luôn mới vì các dict sản phẩm được cập nhật tại chỗ
+    cache = recommendation_cache.for_version(
+        (catalog.version, catalog.availability_version, recommender_service.generation))
+
+    # Lấy token trước khi tính: user có hoạt động mới trong lúc tính thì kết quả lưu vào không khớp token nữa
+    token = user_cache_token(user_id)
+    cached = cache.get(user_id, valid=lambda entry: entry[0] == token)
+    if cached is not None and cached[1] >= n:
+        return cached[2][:n]
 
-    recommendations = recommender.get_recommendations(user_id, n=n)
+    with stage('recommend'):
+        recommendations = recommender.new_session().get_recommendations(user_id, n=n)
 
+    cache.set(user_id, (token, n, recommendations))
     return recommendations
 
 
-def save_search_query(user_id, query):
-    try:
-        with open('search_history.json', 'r', encoding='utf-8') as f:
-            search_history = json.load(f)
-    except:
-        search_history = {}
+def invalidate_user_recommendations(user_id):
+    """Gọi khi user xem, tìm kiếm hoặc đặt hàng: gợi ý của user đó phải tính lại"""
+    with _user_epochs_lock:
+        _user_epochs[user_id] += 1
+    recommendation_cache.pop(user_id)
 
-    user_id_str = str(user_id)
-    if user_id_str not in search_history:
-        search_history[user_id_str] = []
 
-    search_history[user_id_str].insert(0, {
-        'query': query,
-        'timestamp': datetime.now().isoformat()
-    })
+def get_ml_recommendations_batch(user_ids=None, n=6):
+    recommender = recommender_service.get_recommender().new_session()
 
-    search_history[user_id_str] = search_history[user_id_str][:50]
+    # Mặc định: toàn bộ tài khoản
+    if user_ids is None:
+        user_ids = storage.get_user_ids()
 
-    with open('search_history.json', 'w', encoding='utf-8') as f:
-        json.dump(search_history, f, ensure_ascii=False, indent=2)
+    return recommender.get_recommendations_batch(user_ids, n=n)
 
 
+def save_search_query(user_id, query):
+    event_log.record_search(user_id, query)
+    invalidate_user_recommendations(user_id)
+
 if __name__ == '__main__':
     recommender = ProductRecommendationML()
     recommender.train_and_save()
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Cache giới hạn số phần tử, bỏ phần tử lâu không dùng nhất khi đầy; an toàn giữa các thread.
+
+    `ttl` (giây, tuỳ chọn): phần tử quá hạn coi như không có trong cache.
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (giá trị, hạn dùng hoặc None)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None, valid=None):
+        """Giá trị của `key`; `valid(giá trị)` trả về False thì phần tử coi như đã cũ (bị xoá, tính là miss)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and ((entry[1] is not None and entry[1] < time.monotonic())
+                                      or (valid is not None and not valid(entry[0]))):
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        """Xoá một phần tử (vd. khi dữ liệu của user đó thay đổi)"""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def get_or_create(self, key, factory):
+        """Giá trị trong cache, hoặc tạo bằng `factory()` (ngoài lock) rồi lưu lại"""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class VersionedCache(LRUCache):
+    """LRU cache gắn với một version dữ liệu (vd. catalog version): version đổi thì xoá toàn bộ"""
+
+    def __init__(self, maxsize=256, ttl=None):
+        super().__init__(maxsize, ttl)
+        self.version = None
+
+    def for_version(self, version):
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self._data.clear()
+                    self.version = version
+        return self
+
+
+# Trang chủ: HTML phần danh sách sản phẩm / cả trang cho khách, theo (search, brand, category, sort)
+index_cache = VersionedCache(maxsize=256)
+
+# Gợi ý top-N của từng user đã đăng nhập, theo (catalog version, còn/hết hàng, model);
+# mỗi phần tử gắn token hoạt động của user (xem recommendation_ml.user_cache_token)
+recommendation_cache = VersionedCache(maxsize=int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 10000)),
+                                      ttl=float(os.environ.get('RECOMMENDATION_CACHE_TTL', 300)) or None)
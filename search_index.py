@@ -0,0 +1,150 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Trọng số từng trường khi tính tần suất từ
+FIELD_WEIGHTS = {
+    'name': 3,
+    'brand': 2,
+    'category': 1,
+    'description': 1,
+}
+
+
+def fold_diacritics(text):
+    """Bỏ dấu tiếng Việt: 'Văn phòng' -> 'van phong', 'đ' -> 'd'"""
+    text = text.lower().replace('đ', 'd')
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(fold_diacritics(text or ''))
+
+
+class SearchIndex:
+    """Inverted index cho catalog: tìm không dấu, xếp hạng BM25, hỗ trợ prefix cho autocomplete"""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.postings = {}  # term -> {product_id: tf}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.doc_keys = {}
+        self.total_length = 0
+        self._sorted_terms = None
+
+    def _add(self, product):
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(product.get(field)):
+                terms[token] += weight
+
+        pid = product['id']
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[pid] = tf
+        self.doc_terms[pid] = list(terms)
+        self.doc_lengths[pid] = sum(terms.values())
+        self.total_length += self.doc_lengths[pid]
+
+    def _remove(self, pid):
+        for term in self.doc_terms.pop(pid, []):
+            docs = self.postings[term]
+            docs.pop(pid, None)
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(pid, 0)
+        self.doc_keys.pop(pid, None)
+
+    def sync(self, products):
+        """Cập nhật index theo catalog mới, chỉ index lại sản phẩm có nội dung text thay đổi"""
+        with self._lock:
+            seen = set()
+            changed = False
+            for product in products:
+                pid = product['id']
+                seen.add(pid)
+                key = tuple(product.get(field) for field in FIELD_WEIGHTS)
+                if self.doc_keys.get(pid) == key:
+                    continue
+                if pid in self.doc_keys:
+                    self._remove(pid)
+                self._add(product)
+                self.doc_keys[pid] = key
+                changed = True
+
+            for pid in set(self.doc_keys) - seen:
+                self._remove(pid)
+                changed = True
+
+            if changed:
+                self._sorted_terms = None
+
+    def expand_prefix(self, prefix, limit=None):
+        with self._lock:
+            if self._sorted_terms is None:
+                self._sorted_terms = sorted(self.postings)
+            terms = self._sorted_terms
+
+        start = bisect.bisect_left(terms, prefix)
+        matches = []
+        for term in terms[start:]:
+            if not term.startswith(prefix) or (limit and len(matches) >= limit):
+                break
+            matches.append(term)
+        return matches
+
+    def _bm25(self, term, n_docs, avg_length):
+        docs = self.postings.get(term, {})
+        idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        scores = {}
+        for pid, tf in docs.items():
+            norm = 1 - self.b + self.b * self.doc_lengths[pid] / avg_length
+            scores[pid] = idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return scores
+
+    def search(self, query, prefix=True):
+        """Trả về [(product_id, score)] giảm dần theo điểm; mọi từ trong query đều phải khớp,
+        từ cuối được coi là prefix (gõ dở)"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs:
+                return []
+            avg_length = self.total_length / n_docs
+
+            totals = None
+            for i, token in enumerate(tokens):
+                if prefix and i == len(tokens) - 1:
+                    # Từ cuối: lấy điểm cao nhất trong các từ có cùng prefix
+                    token_scores = {}
+                    for term in self.expand_prefix(token):
+                        for pid, score in self._bm25(term, n_docs, avg_length).items():
+                            token_scores[pid] = max(score, token_scores.get(pid, 0.0))
+                else:
+                    token_scores = self._bm25(token, n_docs, avg_length)
+
+                if totals is None:
+                    totals = token_scores
+                else:
+                    totals = {pid: totals[pid] + score for pid, score in token_scores.items()
+                              if pid in totals}
+                if not totals:
+                    return []
+
+        return sorted(totals.items(), key=lambda x: x[1], reverse=True)
+
+    def suggest(self, prefix, limit=10):
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        return self.expand_prefix(tokens[-1], limit=limit)
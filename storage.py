@@ -0,0 +1,529 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from metrics import timed
+
+DB_FILE = 'webmining.db'
+
+# File JSON cũ, dùng cho migration một lần
+USERS_FILE = 'users.json'
+PRODUCTS_FILE = 'products.json'
+ORDERS_FILE = 'orders.json'
+RECENT_VIEWS_FILE = 'recent_views.json'
+SEARCH_HISTORY_FILE = 'search_history.json'
+
+RECENT_VIEWS_LIMIT = 10
+SEARCH_HISTORY_LIMIT = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL,
+    email TEXT,
+    created_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username);
+
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    brand TEXT,
+    category TEXT,
+    price INTEGER NOT NULL,
+    description TEXT,
+    image TEXT,
+    stock INTEGER NOT NULL DEFAULT 0,
+    stock_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_products_brand ON products(brand);
+CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    product_name TEXT,
+    quantity INTEGER NOT NULL,
+    total_price INTEGER NOT NULL,
+    status TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_orders_product_id ON orders(product_id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_product ON orders(user_id, product_id);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at);
+
+CREATE TABLE IF NOT EXISTS recent_views (
+    user_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    viewed_at TEXT NOT NULL,
+    viewed_ts REAL,
+    PRIMARY KEY (user_id, product_id)
+);
+CREATE INDEX IF NOT EXISTS idx_recent_views_user ON recent_views(user_id, viewed_at);
+
+CREATE TABLE IF NOT EXISTS search_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    query TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    ts REAL
+);
+CREATE INDEX IF NOT EXISTS idx_search_history_user ON search_history(user_id, id);
+
+-- Số thứ tự hoạt động của từng user (xem / tìm kiếm / đặt hàng đã ghi xuống database):
+-- cache gợi ý ở mọi worker process so với số này để biết kết quả đã cũ
+CREATE TABLE IF NOT EXISTS user_activity (
+    user_id INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+PRODUCT_FIELDS = ('id', 'name', 'brand', 'category', 'price', 'description', 'image', 'stock')
+ORDER_FIELDS = ('id', 'user_id', 'product_id', 'product_name', 'quantity', 'total_price',
+                'status', 'created_at')
+
+
+
+class OutOfStockError(Exception):
+    """Không đủ hàng để đặt, `available` là số lượng còn lại tại thời điểm đặt"""
+
+    def __init__(self, product_id, available):
+        super().__init__(f'Sản phẩm {product_id} chỉ còn {available}')
+        self.product_id = product_id
+        self.available = available
+
+
+# Cột epoch (giây) tính sẵn từ timestamp ISO, thêm vào database tạo trước khi có cột này
+EPOCH_COLUMNS = (
+    ('recent_views', 'viewed_ts', 'viewed_at'),
+    ('search_history', 'ts', 'timestamp'),
+)
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def get_connection():
+    """Mỗi thread giữ một connection riêng, SQLite ở chế độ WAL"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.db_file == DB_FILE:
+        return conn
+
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+
+    with _schema_lock:
+        if DB_FILE not in _schema_ready:
+            conn.executescript(SCHEMA)
+            _upgrade_schema(conn)
+            _schema_ready.add(DB_FILE)
+
+    _local.conn = conn
+    _local.db_file = DB_FILE
+    return conn
+
+
+def _to_epoch(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _upgrade_schema(conn):
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(products)')}
+    if 'stock_seq' not in columns:
+        with conn:
+            conn.execute('ALTER TABLE products ADD COLUMN stock_seq INTEGER NOT NULL DEFAULT 0')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_stock_seq ON products(stock_seq)')
+
+    for table, column, source in EPOCH_COLUMNS:
+        columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if column in columns:
+            continue
+        with conn:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} REAL')
+            rows = conn.execute(f'SELECT rowid, {source} FROM {table}').fetchall()
+            conn.executemany(
+                f'UPDATE {table} SET {column} = ? WHERE rowid = ?',
+                [(_to_epoch(row[source]), row['rowid']) for row in rows]
+            )
+
+
+def _read_json_file(filename, default):
+    if not os.path.exists(filename):
+        return default
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def migrate_from_json():
+    """Chuyển dữ liệu từ các file JSON sang SQLite (chỉ chạy một lần)"""
+    conn = get_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return False
+
+        products = _read_json_file(PRODUCTS_FILE, [])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO products ({', '.join(PRODUCT_FIELDS)}) "
+            f"VALUES ({', '.join('?' * len(PRODUCT_FIELDS))})",
+            [tuple(p.get(k) for k in PRODUCT_FIELDS) for p in products]
+        )
+
+        users = _read_json_file(USERS_FILE, [])
+        conn.executemany(
+            'INSERT OR IGNORE INTO users (id, username, password, email, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(u['id'], u['username'], u['password'], u.get('email'), u.get('created_at'))
+             for u in users]
+        )
+
+        orders = _read_json_file(ORDERS_FILE, [])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO orders ({', '.join(ORDER_FIELDS)}) "
+            f"VALUES ({', '.join('?' * len(ORDER_FIELDS))})",
+            [tuple(o.get(k) for k in ORDER_FIELDS) for o in orders]
+        )
+
+        recent_views = _read_json_file(RECENT_VIEWS_FILE, {})
+        conn.executemany(
+            'INSERT OR REPLACE INTO recent_views (user_id, product_id, viewed_at, viewed_ts) '
+            'VALUES (?, ?, ?, ?)',
+            [(int(user_id), v['product_id'], v['viewed_at'], _to_epoch(v['viewed_at']))
+             for user_id, views in recent_views.items() for v in views]
+        )
+
+        # File JSON lưu mới nhất trước, chèn ngược lại để id tăng dần theo thời gian
+        search_history = _read_json_file(SEARCH_HISTORY_FILE, {})
+        conn.executemany(
+            'INSERT INTO search_history (user_id, query, timestamp, ts) VALUES (?, ?, ?, ?)',
+            [(int(user_id), s['query'], s['timestamp'], _to_epoch(s['timestamp']))
+             for user_id, searches in search_history.items() for s in reversed(searches)]
+        )
+
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+        _bump_catalog_version(conn)
+
+    print(f"Đã chuyển {len(products)} sản phẩm, {len(users)} user, {len(orders)} đơn hàng sang '{DB_FILE}'")
+    return True
+
+
+def init_db():
+    get_connection()
+    migrate_from_json()
+
+
+# Users
+@timed('db')
+def get_user_by_username(username):
+    row = get_connection().execute(
+        'SELECT * FROM users WHERE username = ?', (username,)
+    ).fetchone()
+    return dict(row) if row else None
+
+
+@timed('db')
+def get_user_ids():
+    return [row['id'] for row in get_connection().execute('SELECT id FROM users ORDER BY id')]
+
+
+@timed('db')
+def add_user(username, password, email, created_at):
+    """Thêm user mới (`password` đã hash), trả về id (sqlite3.IntegrityError nếu username đã tồn tại)"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO users (username, password, email, created_at) VALUES (?, ?, ?, ?)',
+            (username, password, email, created_at)
+        )
+    return cursor.lastrowid
+
+
+@timed('db')
+def update_user_password(user_id, password):
+    conn = get_connection()
+    with conn:
+        conn.execute('UPDATE users SET password = ? WHERE id = ?', (password, user_id))
+
+
+def _bump_activity_seq(conn, user_ids):
+    """Gọi trong cùng transaction với mọi thay đổi dữ liệu hành vi của các user này"""
+    conn.executemany(
+        'INSERT INTO user_activity (user_id, seq) VALUES (?, 1) '
+        'ON CONFLICT(user_id) DO UPDATE SET seq = seq + 1',
+        [(user_id,) for user_id in user_ids]
+    )
+
+
+@timed('db')
+def get_activity_seq(user_id):
+    row = get_connection().execute('SELECT seq FROM user_activity WHERE user_id = ?', (user_id,)).fetchone()
+    return row['seq'] if row else 0
+
+
+# Products
+def _bump_catalog_version(conn):
+    """Gọi trong cùng transaction với mọi thay đổi nội dung bảng products (thêm/sửa sản phẩm)"""
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('catalog_version', '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+
+
+def _bump_stock_seq(conn, product_id):
+    """Gọi trong cùng transaction với mọi thay đổi stock: đánh số thứ tự mới cho sản phẩm đó,
+    process khác chỉ phải đọc lại các hàng có stock_seq lớn hơn lần đọc trước"""
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('stock_seq', '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+    conn.execute(
+        "UPDATE products SET stock_seq = (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'stock_seq') "
+        "WHERE id = ?", (product_id,)
+    )
+
+
+@timed('db')
+def get_catalog_state():
+    """(catalog_version, stock_seq): version tăng khi nội dung đổi, stock_seq tăng khi stock đổi"""
+    values = dict(get_connection().execute(
+        "SELECT key, value FROM meta WHERE key IN ('catalog_version', 'stock_seq')"
+    ).fetchall())
+    return int(values.get('catalog_version', 0)), int(values.get('stock_seq', 0))
+
+
+@timed('db')
+def claim_model_refresh(catalog_version, lease_seconds):
+    """Xin quyền cập nhật model cho `catalog_version`, chỉ một worker process được nhận.
+
+    Trả về 'claimed' (process này cập nhật), 'busy' (process khác đang cập nhật, lease chưa hết)
+    hoặc 'done' (đã cập nhật xong / đã thử và lỗi, hoặc đã có version mới hơn).
+    Process nhận quyền mà chết giữa chừng thì hết `lease_seconds` process khác nhận lại.
+    """
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute("SELECT value FROM meta WHERE key = 'model_refresh'").fetchone()
+        if row:
+            state = json.loads(row['value'])
+            if state['catalog_version'] > catalog_version:
+                return 'done'
+            if state['catalog_version'] == catalog_version:
+                if state['done']:
+                    return 'done'
+                if state['lease_until'] > now:
+                    return 'busy'
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('model_refresh', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (json.dumps({'catalog_version': catalog_version, 'lease_until': now + lease_seconds, 'done': False}),)
+        )
+    return 'claimed'
+
+
+@timed('db')
+def finish_model_refresh(catalog_version):
+    """Đánh dấu đã xử lý xong `catalog_version` (kể cả khi lỗi: không process nào thử lại version đó)"""
+    conn = get_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute("SELECT value FROM meta WHERE key = 'model_refresh'").fetchone()
+        # Process khác đã nhận version mới hơn: giữ nguyên
+        if row and json.loads(row['value'])['catalog_version'] == catalog_version:
+            conn.execute(
+                "UPDATE meta SET value = ? WHERE key = 'model_refresh'",
+                (json.dumps({'catalog_version': catalog_version, 'lease_until': 0, 'done': True}),)
+            )
+
+
+@timed('db')
+def get_stock_changes(after_seq):
+    """[{id, stock, stock_seq}] của các sản phẩm đổi stock sau `after_seq` (theo index stock_seq)"""
+    return [dict(row) for row in get_connection().execute(
+        'SELECT id, stock, stock_seq FROM products WHERE stock_seq > ? ORDER BY stock_seq', (after_seq,)
+    )]
+
+
+@timed('db')
+def get_products():
+    return [dict(row) for row in get_connection().execute(
+        f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products ORDER BY rowid"
+    )]
+
+
+@timed('db')
+def save_product(product):
+    conn = get_connection()
+    updates = ', '.join(f'{k} = excluded.{k}' for k in PRODUCT_FIELDS if k != 'id')
+    with conn:
+        conn.execute(
+            f"INSERT INTO products ({', '.join(PRODUCT_FIELDS)}) "
+            f"VALUES ({', '.join('?' * len(PRODUCT_FIELDS))}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}",
+            tuple(product.get(k) for k in PRODUCT_FIELDS)
+        )
+        _bump_catalog_version(conn)
+
+
+# Orders
+@timed('db')
+def get_orders_after(order_id):
+    """Các đơn hàng có id lớn hơn `order_id` (dùng để đọc tiếp đơn mới)"""
+    return [dict(row) for row in get_connection().execute(
+        'SELECT * FROM orders WHERE id > ? ORDER BY id', (order_id,)
+    )]
+
+
+@timed('db')
+def get_orders_since(created_at):
+    """Các đơn hàng tạo từ thời điểm `created_at` (ISO) trở đi, theo index created_at"""
+    return [dict(row) for row in get_connection().execute(
+        'SELECT * FROM orders WHERE created_at >= ? ORDER BY id', (created_at,)
+    )]
+
+
+@timed('db')
+def get_purchased_product_ids(user_id):
+    return {row['product_id'] for row in get_connection().execute(
+        'SELECT DISTINCT product_id FROM orders WHERE user_id = ?', (user_id,)
+    )}
+
+
+@timed('db')
+def get_orders_page(user_id, before_id=None, limit=20):
+    """Một trang đơn hàng của user, mới nhất trước (theo index (user_id, id));
+    `before_id` là id đơn cuối của trang trước"""
+    if before_id is None:
+        rows = get_connection().execute(
+            'SELECT * FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT ?', (user_id, limit)
+        )
+    else:
+        rows = get_connection().execute(
+            'SELECT * FROM orders WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (user_id, before_id, limit)
+        )
+    return [dict(row) for row in rows]
+
+
+@timed('db')
+def place_order(user_id, product_id, quantity, status, created_at):
+    """Trừ kho và tạo đơn hàng trong một transaction.
+
+    BEGIN IMMEDIATE giữ khoá ghi của database, nên an toàn giữa các thread lẫn các
+    worker process. Trừ kho có điều kiện `stock >= quantity` nên không bao giờ bán âm;
+    id đơn hàng do AUTOINCREMENT cấp, tăng dần và không tái sử dụng.
+    Trả về None nếu sản phẩm không tồn tại, raise OutOfStockError nếu không đủ hàng.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        product = conn.execute(
+            'SELECT name, price, stock FROM products WHERE id = ?', (product_id,)
+        ).fetchone()
+        if product is None:
+            return None
+
+        updated = conn.execute(
+            'UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+            (quantity, product_id, quantity)
+        ).rowcount
+        if not updated:
+            raise OutOfStockError(product_id, product['stock'])
+
+        order = {
+            'user_id': user_id,
+            'product_id': product_id,
+            'product_name': product['name'],
+            'quantity': quantity,
+            'total_price': product['price'] * quantity,
+            'status': status,
+            'created_at': created_at
+        }
+        cursor = conn.execute(
+            'INSERT INTO orders (user_id, product_id, product_name, quantity, total_price, status, created_at) '
+            'VALUES (:user_id, :product_id, :product_name, :quantity, :total_price, :status, :created_at)',
+            order
+        )
+        # Chỉ stock đổi: không tăng catalog_version (không phải load lại catalog / model)
+        _bump_stock_seq(conn, product_id)
+        _bump_activity_seq(conn, [user_id])
+
+    return {'id': cursor.lastrowid, **order}
+
+
+# Recent views
+@timed('db')
+def get_recent_views(user_id, limit=RECENT_VIEWS_LIMIT):
+    """Sản phẩm user đã xem, mới nhất trước"""
+    return [dict(row) for row in get_connection().execute(
+        'SELECT product_id, viewed_at, viewed_ts FROM recent_views WHERE user_id = ? '
+        'ORDER BY viewed_at DESC LIMIT ?', (user_id, limit)
+    )]
+
+
+@timed('db')
+def record_views(views, limit=RECENT_VIEWS_LIMIT):
+    """Ghi một lô (user_id, product_id, viewed_at) theo thứ tự thời gian: mỗi sản phẩm được
+    đưa lên đầu danh sách đã xem, mỗi user chỉ giữ `limit` lượt gần nhất"""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO recent_views (user_id, product_id, viewed_at, viewed_ts) '
+            'VALUES (?, ?, ?, ?)',
+            [(user_id, product_id, viewed_at, _to_epoch(viewed_at))
+             for user_id, product_id, viewed_at in views]
+        )
+        conn.executemany(
+            'DELETE FROM recent_views WHERE user_id = ? AND product_id NOT IN ('
+            'SELECT product_id FROM recent_views WHERE user_id = ? ORDER BY viewed_at DESC LIMIT ?)',
+            [(user_id, user_id, limit) for user_id in {v[0] for v in views}]
+        )
+        _bump_activity_seq(conn, {v[0] for v in views})
+
+
+# Search history
+@timed('db')
+def get_search_times(user_id, limit=20):
+    """Thời điểm (epoch) các lần tìm kiếm gần nhất của user, mới nhất trước"""
+    return [row['ts'] for row in get_connection().execute(
+        'SELECT ts FROM search_history WHERE user_id = ? AND ts IS NOT NULL ORDER BY id DESC LIMIT ?',
+        (user_id, limit)
+    )]
+
+
+@timed('db')
+def add_searches(searches, limit=SEARCH_HISTORY_LIMIT):
+    """Ghi một lô (user_id, query, timestamp) theo thứ tự thời gian, mỗi user giữ `limit` lượt"""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO search_history (user_id, query, timestamp, ts) VALUES (?, ?, ?, ?)',
+            [(user_id, query, timestamp, _to_epoch(timestamp)) for user_id, query, timestamp in searches]
+        )
+        conn.executemany(
+            'DELETE FROM search_history WHERE user_id = ? AND id NOT IN ('
+            'SELECT id FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT ?)',
+            [(user_id, user_id, limit) for user_id in {s[0] for s in searches}]
+        )
+        _bump_activity_seq(conn, {s[0] for s in searches})
+
+
+if __name__ == '__main__':
+    init_db()
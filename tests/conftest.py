@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Database, file JSON và event log đều dùng đường dẫn tương đối: chạy trong thư mục tạm
+    monkeypatch.chdir(tmp_path)
+    import main
+    import storage
+    from catalog import catalog
+    from event_log import event_log
+
+    monkeypatch.setattr(storage, 'DB_FILE', str(tmp_path / 'webmining.db'))
+    catalog.invalidate()
+    main.init_files()
+    client = main.app.test_client()
+    client.post('/register', data={'username': 'buyer', 'password': 'pw', 'email': 'buyer@example.com'})
+    client.post('/login', data={'username': 'buyer', 'password': 'pw'})
+    yield client
+    event_log.flush()
@@ -0,0 +1,56 @@
+import storage
+from catalog import ProductCatalog, catalog
+
+
+def test_order_updates_stock_without_reloading_catalog(client):
+    other_worker = ProductCatalog(check_interval=0)
+    other_worker.refresh()
+    version = catalog.version
+    products = catalog.all()
+    stock = catalog.get(7)['stock']
+
+    client.post('/order/7', data={'quantity': '1'})
+
+    # Không load lại: vẫn là các dict cũ, stock được cập nhật tại chỗ
+    assert catalog.version == version
+    assert catalog.all() is products
+    assert catalog.get(7)['stock'] == stock - 1
+    assert other_worker.get(7)['stock'] == stock - 1
+
+
+def test_availability_version_changes_when_product_sells_out(client):
+    catalog.refresh()
+    availability = catalog.availability_version
+    stock = catalog.get(7)['stock']
+
+    client.post('/order/7', data={'quantity': str(stock - 1)})
+    assert catalog.availability_version == availability
+
+    client.post('/order/7', data={'quantity': '1'})
+    assert catalog.get(7)['stock'] == 0
+    assert catalog.availability_version == availability + 1
+
+
+def test_save_product_bumps_content_version(client):
+    version = catalog.version
+    storage.save_product({**catalog.get(7), 'description': 'Mô tả mới'})
+    catalog.refresh(force=True)
+
+    assert catalog.version != version
+    assert catalog.get(7)['description'] == 'Mô tả mới'
+
+
+def test_reads_check_database_state_once_per_interval(client, monkeypatch):
+    local = ProductCatalog(check_interval=60)
+    local.refresh()
+    calls = []
+    get_state = storage.get_catalog_state
+    monkeypatch.setattr(storage, 'get_catalog_state', lambda: calls.append(1) or get_state())
+
+    for _ in range(10):
+        local.get(7)
+        local.all()
+    assert calls == []
+
+    local.refresh(force=True)
+    assert calls == [1]
@@ -0,0 +1,21 @@
+from catalog import catalog
+from cold_start import ColdStartRankings
+
+
+def test_popular_picks_up_new_orders_without_catalog_change(client):
+    rankings = ColdStartRankings(refresh_interval=0)
+    first = rankings.top(1, strategy='popular')[0]['id']
+    target = next(pid for pid in rankings.price_band if pid != first)
+
+    client.post('/order/%d' % target, data={'quantity': '3'})
+
+    assert rankings.top(1, strategy='popular')[0]['id'] == target
+    category = catalog.get(target)['category']
+    assert rankings.top(1, category=category)[0]['id'] == target
+
+
+def test_anonymous_homepage_shows_popular_products(client):
+    client.get('/logout')
+    html = client.get('/').get_data(as_text=True)
+
+    assert 'BÁN CHẠY NHẤT' in html
@@ -0,0 +1,42 @@
+import json
+import os
+
+from event_log import EventLogTailer
+
+
+def write_events(path, start, count):
+    with open(path, 'a', encoding='utf-8') as f:
+        for i in range(start, start + count):
+            f.write(json.dumps({'i': i}) + '\n')
+
+
+def rotate(log_file, stamp):
+    os.rename(log_file, log_file.replace('.log', f'-{stamp}.log'))
+
+
+def test_tailer_reads_every_rotation_between_reads(tmp_path):
+    log_file = str(tmp_path / 'events.log')
+    write_events(log_file, 0, 5)
+    tailer = EventLogTailer(log_file)
+    assert [e['i'] for e in tailer.read_new()] == list(range(5))
+
+    write_events(log_file, 5, 5)
+    rotate(log_file, '20260101000001000000')
+    for n, stamp in enumerate(['20260101000002000000', '20260101000003000000']):
+        write_events(log_file, 10 + 5 * n, 5)
+        rotate(log_file, stamp)
+    write_events(log_file, 20, 5)
+
+    assert [e['i'] for e in tailer.read_new()] == list(range(5, 25))
+    assert tailer.read_new() == []
+
+
+def test_tailer_replays_rotated_files_on_first_start(tmp_path):
+    log_file = str(tmp_path / 'events.log')
+    write_events(log_file, 0, 3)
+    rotate(log_file, '20260101000001000000')
+    write_events(log_file, 3, 3)
+    rotate(log_file, '20260101000002000000')
+    write_events(log_file, 6, 3)
+
+    assert [e['i'] for e in EventLogTailer(log_file).read_new()] == list(range(9))
@@ -0,0 +1,52 @@
+import storage
+from catalog import catalog
+from recommendation_ml import ProductRecommendationML, RecommenderService
+
+
+def edit_product(product_id):
+    product = catalog.get(product_id)
+    storage.save_product({**product, 'description': catalog.get(product_id + 1)['description']})
+    catalog.refresh(force=True)
+
+
+def test_claim_is_granted_to_one_process_per_version(client):
+    assert storage.claim_model_refresh(5, lease_seconds=60) == 'claimed'
+    assert storage.claim_model_refresh(5, lease_seconds=60) == 'busy'
+    assert storage.claim_model_refresh(4, lease_seconds=60) == 'done'
+
+    storage.finish_model_refresh(5)
+    assert storage.claim_model_refresh(5, lease_seconds=60) == 'done'
+    assert storage.claim_model_refresh(6, lease_seconds=60) == 'claimed'
+
+
+def test_expired_lease_can_be_claimed_again(client):
+    assert storage.claim_model_refresh(5, lease_seconds=-1) == 'claimed'
+    assert storage.claim_model_refresh(5, lease_seconds=60) == 'claimed'
+
+
+def test_only_one_worker_publishes_a_catalog_edit(client, tmp_path):
+    model_dir = str(tmp_path / 'recommendation_model')
+    workers = [RecommenderService(model_dir), RecommenderService(model_dir)]
+    assert workers[0].refresh_model() == 'unchanged'
+    assert workers[1].refresh_model() == 'skipped'
+    edit_product(7)
+
+    assert workers[0].refresh_model() in ('incremental', 'full')
+    assert workers[1].refresh_model() == 'skipped'
+    assert workers[1]._catalog_version == catalog.version
+    # Worker còn lại dùng bản vừa được ghi qua con trỏ CURRENT
+    assert workers[1].get_recommender().diff_catalog(catalog.all())[1:] == ([], [])
+
+
+def test_failed_refresh_is_not_retried(client, tmp_path, monkeypatch):
+    service = RecommenderService(str(tmp_path / 'recommendation_model'))
+    service.refresh_model()
+    edit_product(7)
+
+    def fail(self, products):
+        raise RuntimeError('update failed')
+
+    monkeypatch.setattr(ProductRecommendationML, 'update_model', fail)
+    assert service.refresh_model() is None
+    assert service._catalog_version == catalog.version
+    assert storage.claim_model_refresh(catalog.version, lease_seconds=60) == 'done'
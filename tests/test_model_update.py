@@ -0,0 +1,57 @@
+import numpy as np
+
+from catalog import catalog
+from recommendation_ml import ProductRecommendationML
+
+
+def trained_model(tmp_path):
+    model = ProductRecommendationML()
+    model.model_dir = str(tmp_path / 'recommendation_model')
+    model.train_and_save()
+    return model
+
+
+def test_saved_model_keeps_text_hashes_mmapped(client, tmp_path):
+    trained_model(tmp_path)
+    loaded = ProductRecommendationML()
+    loaded.model_dir = str(tmp_path / 'recommendation_model')
+
+    assert loaded.load_model()
+    assert isinstance(loaded.product_hashes, np.memmap)
+    assert loaded.product_hashes.dtype == np.int64
+    assert loaded.diff_catalog(catalog.all())[1:] == ([], [])
+
+
+def test_diff_catalog_detects_changed_and_removed_products(client, tmp_path):
+    model = trained_model(tmp_path)
+    products = [dict(p) for p in catalog.all() if p['id'] != 3]
+    # Text mới dùng từ đã có trong vocabulary: cập nhật tăng dần, không train lại
+    products[0]['description'] = products[5]['description']
+    products[1]['stock'] += 5
+
+    _, changed, removed = model.diff_catalog(products)
+    assert changed == [products[0]['id']]
+    assert removed == [3]
+
+    assert model.update_model(products) == 'incremental'
+    assert model.diff_catalog(products)[1:] == ([], [])
+
+
+def test_incremental_neighbours_match_full_rebuild_after_removal(client):
+    model = ProductRecommendationML()
+    model.neighbor_k = 3
+    model.load_data()
+    model.build_product_features()
+    model.build_neighbor_index()
+    assert (model.neighbor_ids == 3).any(axis=1).sum() > 0
+
+    products = [p for p in catalog.all() if p['id'] != 3]
+    assert model.update_model(products) == 'incremental'
+    incremental = dict(zip(model.product_ids.tolist(), model.neighbor_scores.tolist()))
+
+    model.build_neighbor_index()
+    full = dict(zip(model.product_ids.tolist(), model.neighbor_scores.tolist()))
+    assert 3 not in model.neighbor_ids
+    assert incremental.keys() == full.keys()
+    for pid, scores in full.items():
+        assert np.allclose(incremental[pid], scores, atol=1e-6)
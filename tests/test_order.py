@@ -0,0 +1,68 @@
+import pytest
+
+
+def order_count(user_id=1):
+    import storage
+    return len(storage.get_orders_page(user_id, limit=100))
+
+
+@pytest.mark.parametrize('quantity', ['abc', '', '2.5', '0', '-1'])
+def test_order_rejects_invalid_quantity(client, quantity):
+    before = order_count()
+    response = client.post('/order/7', data={'quantity': quantity})
+
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/product/7')
+    assert order_count() == before
+
+
+def test_order_defaults_to_one_when_quantity_missing(client):
+    import storage
+    before = order_count()
+    response = client.post('/order/7')
+
+    assert response.status_code == 302
+    assert order_count() == before + 1
+    assert storage.get_orders_page(1, limit=1)[0]['quantity'] == 1
+
+
+def test_order_accepts_integer_quantity(client):
+    import storage
+    client.post('/order/7', data={'quantity': '2'})
+
+    assert storage.get_orders_page(1, limit=1)[0]['quantity'] == 2
+
+
+def test_concurrent_orders_never_oversell(client):
+    import threading
+    from datetime import datetime
+
+    import storage
+
+    stock = 5
+    with storage.get_connection() as conn:
+        conn.execute('UPDATE products SET stock = ? WHERE id = 7', (stock,))
+    before = order_count()
+
+    # Mỗi thread dùng một connection SQLite riêng, cùng bắt đầu đặt hàng một lúc
+    start = threading.Barrier(16)
+    orders, rejected = [], []
+
+    def buy():
+        start.wait()
+        try:
+            orders.append(storage.place_order(1, 7, 1, 'Đang xử lý', datetime.now().isoformat()))
+        except storage.OutOfStockError:
+            rejected.append(1)
+
+    threads = [threading.Thread(target=buy) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(orders) == stock
+    assert len(rejected) == 16 - stock
+    assert len({order['id'] for order in orders}) == stock
+    assert order_count() == before + stock
+    assert storage.get_connection().execute('SELECT stock FROM products WHERE id = 7').fetchone()[0] == 0
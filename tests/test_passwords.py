@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def test_saturated_pool_rejects_immediately():
+    hasher = PasswordHasher(workers=1, queue_size=0, method='pbkdf2:sha256:1000')
+    started, release = threading.Event(), threading.Event()
+
+    def slow(*args):
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=hasher._run, args=(slow,))
+    worker.start()
+    started.wait(5)
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash('pw')
+    finally:
+        release.set()
+        worker.join()
+
+    assert hasher.verify(hasher.hash('pw'), 'pw')
+
+
+def test_plaintext_password_needs_rehash():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000')
+    assert hasher.verify('123456', '123456')
+    assert not hasher.verify('123456', '1234567')
+    assert hasher.needs_rehash('123456')
+    assert not hasher.needs_rehash(hasher.hash('123456'))
+
+
+def test_login_succeeds_when_rehash_pool_is_busy(client, monkeypatch):
+    from main import password_hasher
+
+    def busy(password):
+        raise PasswordHasherBusy()
+
+    client.get('/logout')
+    monkeypatch.setattr(password_hasher, 'needs_rehash', lambda stored: True)
+    monkeypatch.setattr(password_hasher, 'hash', busy)
+    response = client.post('/login', data={'username': 'buyer', 'password': 'pw'})
+
+    assert response.status_code == 302
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import recommendation_ml
+import storage
+from response_cache import recommendation_cache
+
+
+def test_recompute_racing_with_invalidation_is_not_served(client, monkeypatch):
+    user_id = storage.get_user_by_username('buyer')['id']
+    compute = recommendation_ml.ProductRecommendationML.get_recommendations
+
+    def view_during_compute(self, uid, n=6):
+        result = compute(self, uid, n=n)
+        # User xem sản phẩm khi kết quả cũ chưa kịp lưu vào cache
+        recommendation_ml.invalidate_user_recommendations(uid)
+        return result
+
+    monkeypatch.setattr(recommendation_ml.ProductRecommendationML, 'get_recommendations', view_during_compute)
+    recommendation_ml.get_ml_recommendations(user_id)
+    monkeypatch.setattr(recommendation_ml.ProductRecommendationML, 'get_recommendations', compute)
+
+    misses = recommendation_cache.misses
+    recommendation_ml.get_ml_recommendations(user_id)
+    assert recommendation_cache.misses == misses + 1
+
+
+def test_activity_written_by_another_worker_invalidates_cache(client):
+    user_id = storage.get_user_by_username('buyer')['id']
+    recommendation_ml.get_ml_recommendations(user_id)
+
+    hits = recommendation_cache.hits
+    recommendation_ml.get_ml_recommendations(user_id)
+    assert recommendation_cache.hits == hits + 1
+
+    # Worker khác flush lượt xem của user xuống database
+    storage.record_views([(user_id, 3, datetime.now().isoformat())])
+    misses = recommendation_cache.misses
+    recommendation_ml.get_ml_recommendations(user_id)
+    assert recommendation_cache.misses == misses + 1
@@ -0,0 +1,29 @@
+import heapq
+import random
+
+from trending import DAY, HOUR, RollingCounter
+
+
+def test_window_top_k_matches_full_sort_as_buckets_expire():
+    rng = random.Random(7)
+    windows = {'1h': 1, '24h': 24}
+    counter = RollingCounter(HOUR, windows, k=5)
+    events = []
+    now = 0.0
+    for _ in range(3000):
+        now += rng.uniform(0, 120)
+        counter.advance(now)
+        product_id = rng.randrange(40)
+        counter.add(product_id, now)
+        events.append((product_id, now))
+
+        if len(events) % 100 == 0:
+            current = int(now // HOUR)
+            for name, size in windows.items():
+                totals = {}
+                for pid, ts in events:
+                    if int(ts // HOUR) > current - size:
+                        totals[pid] = totals.get(pid, 0) + 1
+                expected = sorted(count for _, count in heapq.nlargest(5, totals.items(), key=lambda x: x[1]))
+                assert sorted(count for _, count in counter.totals[name].items()) == expected
+    assert now > 2 * DAY
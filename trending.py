@@ -0,0 +1,156 @@
+import math
+import threading
+import time
+from collections import Counter
+
+import storage
+from analytics import TopK, to_epoch
+from event_log import EventLogTailer
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Một đơn hàng được tính bằng ORDER_WEIGHT lượt xem
+ORDER_WEIGHT = 3
+
+
+class RollingCounter:
+    """Đếm theo bucket thời gian cố định, giữ sẵn tổng và top K của từng cửa sổ.
+
+    Khi thời gian trôi, bucket ra khỏi cửa sổ nào thì bị trừ khỏi tổng của cửa sổ đó (top K
+    được chọn lại, mỗi bucket một lần), nên truy vấn không phải cộng lại các bucket hay sắp xếp.
+    """
+
+    def __init__(self, bucket_seconds, windows, k=50):
+        self.bucket_seconds = bucket_seconds
+        self.windows = windows  # tên cửa sổ -> số bucket
+        self.retention = max(windows.values())
+        self.buckets = {}
+        self.totals = {name: TopK(k) for name in windows}
+        self.current = None
+
+    def advance(self, now):
+        now_idx = int(now // self.bucket_seconds)
+        if self.current is not None and now_idx <= self.current:
+            return False
+
+        previous = self.current
+        self.current = now_idx
+        if previous is None:
+            return False
+
+        for name, size in self.windows.items():
+            # Các bucket vừa rơi ra khỏi cửa sổ: (previous - size, now_idx - size]
+            expired = Counter()
+            for idx, bucket in self.buckets.items():
+                if previous - size < idx <= now_idx - size:
+                    expired.update(bucket)
+            if expired:
+                self.totals[name].subtract(expired)
+
+        for idx in [i for i in self.buckets if i <= now_idx - self.retention]:
+            del self.buckets[idx]
+        return True
+
+    def add(self, key, ts, amount=1):
+        if self.current is None:
+            self.advance(ts)
+
+        idx = int(ts // self.bucket_seconds)
+        if idx <= self.current - self.retention:
+            return False
+
+        self.buckets.setdefault(idx, Counter())[key] += amount
+        for name, size in self.windows.items():
+            if idx > self.current - size:
+                self.totals[name].add(key, amount)
+        return True
+
+
+class TrendingEngine:
+    """Sản phẩm trending theo lượt xem và đơn hàng.
+
+    - Cửa sổ '1h', '24h' dùng bucket theo giờ; '7d', '30d' dùng bucket theo ngày.
+    - 'decayed': điểm giảm theo hàm mũ (chu kỳ bán rã `half_life`), lưu dưới dạng
+      w * e^(λ(t - t0)) nên điểm chỉ tăng và top-K được giữ sẵn trong heap.
+    """
+
+    HOURLY_WINDOWS = {'1h': 1, '24h': 24}
+    DAILY_WINDOWS = {'7d': 7, '30d': 30}
+
+    def __init__(self, half_life=DAY, k=50):
+        self.hourly = RollingCounter(HOUR, self.HOURLY_WINDOWS, k)
+        self.daily = RollingCounter(DAY, self.DAILY_WINDOWS, k)
+        self.decay_rate = math.log(2) / half_life
+        self.decayed = TopK(k)
+        self._t0 = time.time()
+        self._cache = {}
+        # Khởi động lại: chỉ cần đọc lại log trong cửa sổ dài nhất
+        self._tailer = EventLogTailer(history=(max(self.DAILY_WINDOWS.values()) + 1) * DAY)
+        self._last_order_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def windows(self):
+        return list(self.HOURLY_WINDOWS) + list(self.DAILY_WINDOWS) + ['decayed']
+
+    def _advance(self, now):
+        if self.hourly.advance(now) | self.daily.advance(now):
+            self._cache.clear()
+
+    def add(self, product_id, ts, weight=1):
+        self.hourly.add(product_id, ts, weight)
+        self.daily.add(product_id, ts, weight)
+
+        exponent = self.decay_rate * (ts - self._t0)
+        if exponent > 500:
+            # Đổi mốc t0 để tránh tràn số; thứ tự các điểm không đổi
+            self.decayed.scale(math.exp(-exponent))
+            self._t0 = ts
+            exponent = 0.0
+        self.decayed.add(product_id, weight * math.exp(exponent))
+        self._cache.clear()
+
+    def refresh(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._advance(now)
+
+            for event in self._tailer.read_new():
+                ts = to_epoch(event.get('ts'))
+                if event['type'] == 'view' and ts is not None:
+                    self.add(event['product_id'], ts)
+
+            for order in storage.get_orders_after(self._last_order_id):
+                ts = to_epoch(order['created_at'])
+                if ts is not None:
+                    self.add(order['product_id'], ts, ORDER_WEIGHT * order['quantity'])
+                self._last_order_id = order['id']
+        return self
+
+    def top(self, window='7d', n=10):
+        """[(product_id, điểm)] của cửa sổ `window`, điểm giảm dần"""
+        self.refresh()
+        key = (window, n)
+        # Giữ lock khi đọc: refresh() của thread khác sửa các Counter và xoá cache
+        with self._lock:
+            result = self._cache.get(key)
+            if result is None:
+                if window == 'decayed':
+                    top = self.decayed
+                elif window in self.HOURLY_WINDOWS:
+                    top = self.hourly.totals[window]
+                else:
+                    top = self.daily.totals[window]
+                result = top.items()[:n]
+                self._cache[key] = result
+        return result
+
+    @staticmethod
+    def window_for_days(days):
+        if days <= 1:
+            return '24h'
+        return '7d' if days <= 7 else '30d'
+
+
+trending = TrendingEngine()